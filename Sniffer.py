@@ -1,13 +1,30 @@
 import os
 import re
 import asyncio
+import collections
+import heapq
+import functools
+import itertools
 import logging
+import math
 import sqlite3
-from datetime import datetime
-from typing import Optional, List, Tuple
+import time
+import threading
+import queue
+import random
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional, List, Set, Tuple, TypeVar
 
 import aiohttp
+from aiohttp import web
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -19,6 +36,11 @@ from telegram.ext import (
     filters,
 )
 
+try:
+    import numpy as np
+except ImportError:   # optional: vectorized change detection in WalletRegistry.diff
+    np = None
+
 # =========================
 # CONFIG
 # =========================
@@ -28,10 +50,103 @@ logging.basicConfig(
 )
 logger = logging.getLogger("sol_watch_bot")
 
+T = TypeVar("T")
+
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 SOLANA_RPC_URL = os.getenv("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com").strip()
+# Several providers, comma-separated, each "url" or "url;weight=2;rps=50" (rps = JSON-RPC
+# calls per second to that endpoint, batch items counted individually; 0 = unlimited).
+# Overrides SOLANA_RPC_URL when set.
+SOLANA_RPC_URLS = os.getenv("SOLANA_RPC_URLS", "").strip() or SOLANA_RPC_URL
 DB_PATH = os.getenv("DB_PATH", "data.db").strip()
 CHECK_INTERVAL_SECONDS = int(os.getenv("CHECK_INTERVAL_SECONDS", "10"))
+# Time budget per scan batch; 0 means 80% of the scan interval.
+SCAN_BUDGET_SECONDS = float(os.getenv("SCAN_BUDGET_SECONDS", "0"))
+
+# The scan interval is split into wheel slots of about one RPC batch each; this bounds
+# how short a tick (and so how small and frequent a batch) can get.
+WHEEL_MIN_TICK_SECONDS = float(os.getenv("WHEEL_MIN_TICK_SECONDS", "0.25"))
+
+# An address the RPC keeps rejecting on its own (invalid params, isolated by bisecting
+# its batch) is retried after interval x 2^failures, up to ADDRESS_BACKOFF_MAX_SECONDS.
+ADDRESS_BACKOFF_MAX_SECONDS = float(os.getenv("ADDRESS_BACKOFF_MAX_SECONDS", "3600"))
+
+# Adaptive polling: an address unchanged for ADAPTIVE_HOT_SECONDS drops a tier, and each
+# doubling of its idle time doubles its poll interval, up to ADAPTIVE_MAX_INTERVAL_SECONDS.
+# Any observed change puts it straight back on every pass.
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "1").strip() not in ("0", "false", "no")
+ADAPTIVE_HOT_SECONDS = float(os.getenv("ADAPTIVE_HOT_SECONDS", "600"))
+ADAPTIVE_MAX_INTERVAL_SECONDS = float(os.getenv("ADAPTIVE_MAX_INTERVAL_SECONDS", "300"))
+# A change smaller than this many lamports (either way) neither alerts nor moves the stored
+# balance, so small movements add up until they cross it. 0 alerts on every change.
+ALERT_MIN_LAMPORTS = int(os.getenv("ALERT_MIN_LAMPORTS", "0"))
+# With NumPy installed, fetched batches of at least this many balances are compared in
+# vectorized form; smaller ones (and all of them without NumPy) take the plain loop.
+VECTORIZE_MIN_BATCH = int(os.getenv("VECTORIZE_MIN_BATCH", "4096"))
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_WRITE_CHUNK = 500
+LOOP_LAG_REPORT_SECONDS = int(os.getenv("LOOP_LAG_REPORT_SECONDS", "60"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip()
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))   # 0 disables /metrics
+
+# Telegram allows ~30 msg/s overall and ~1 msg/s per chat
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+ALERT_QUEUE_MAX = int(os.getenv("ALERT_QUEUE_MAX", "10000"))
+ALERT_MAX_ATTEMPTS = 5
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# getMultipleAccounts accepts at most 100 pubkeys per call
+RPC_BATCH_SIZE = 100
+RPC_TIMEOUT_SECONDS = 12
+RPC_INVALID_PARAMS = -32602
+RPC_BLOCK_NOT_AVAILABLE = -32004
+RPC_SLOT_SKIPPED = -32007
+RPC_LONG_TERM_STORAGE_SLOT_SKIPPED = -32009
+RPC_BATCH_WINDOW_MS = float(os.getenv("RPC_BATCH_WINDOW_MS", "5"))
+RPC_BATCH_MAX_CALLS = int(os.getenv("RPC_BATCH_MAX_CALLS", "10"))
+# Per-endpoint circuit breaker: this many failed requests in a row open it; after
+# RPC_PROBE_SECONDS a getSlot probe (half-open) closes it again or doubles the wait,
+# up to RPC_BREAKER_MAX_OPEN_SECONDS. With every breaker open, calls fail immediately.
+# Scans pause on the same schedule while the provider answers every batch with an error.
+RPC_EJECT_FAILURES = int(os.getenv("RPC_EJECT_FAILURES", "3"))
+RPC_PROBE_SECONDS = float(os.getenv("RPC_PROBE_SECONDS", "5"))
+RPC_BREAKER_MAX_OPEN_SECONDS = float(os.getenv("RPC_BREAKER_MAX_OPEN_SECONDS", "60"))
+# Client-side provider quota shared by every RPC caller (0 = unlimited): JSON-RPC calls/s,
+# credits/s (RPC_METHOD_CREDITS prices methods, "getBlock=10,getMultipleAccounts=2";
+# unlisted methods cost 1) and concurrent HTTP requests. A 429 pauses the endpoint that
+# sent it for its Retry-After; with one endpoint that is every caller.
+RPC_MAX_RPS = float(os.getenv("RPC_MAX_RPS", "0"))
+RPC_MAX_CREDITS_PER_SECOND = float(os.getenv("RPC_MAX_CREDITS_PER_SECOND", "0"))
+RPC_MAX_INFLIGHT = int(os.getenv("RPC_MAX_INFLIGHT", "0"))
+RPC_METHOD_CREDITS = os.getenv("RPC_METHOD_CREDITS", "").strip()
+RPC_THROTTLE_RETRIES = 2
+# Hedging: a request still unanswered after the running p95 round trip is duplicated to
+# another endpoint and the first answer wins. The rate caps hedges as a fraction of
+# requests (e.g. 0.05); 0 turns hedging off.
+RPC_HEDGE_MAX_RATE = float(os.getenv("RPC_HEDGE_MAX_RATE", "0"))
+RPC_RETRY_AFTER_MAX_SECONDS = 60.0
+# Scan fetches run under an AIMD concurrency limit: +1 per limit's worth of healthy
+# responses, halved on 429/5xx/timeouts or latency above RPC_LATENCY_TOLERANCE x baseline.
+RPC_CONCURRENCY_INITIAL = int(os.getenv("RPC_CONCURRENCY_INITIAL", "8"))
+RPC_CONCURRENCY_MIN = int(os.getenv("RPC_CONCURRENCY_MIN", "1"))
+RPC_CONCURRENCY_MAX = int(os.getenv("RPC_CONCURRENCY_MAX", "64"))
+RPC_LATENCY_TOLERANCE = float(os.getenv("RPC_LATENCY_TOLERANCE", "2.0"))
+
+# "poll" scans every CHECK_INTERVAL_SECONDS; "ws" receives accountSubscribe pushes and
+# "blocks" reads every confirmed block; both only poll every WS_RECONCILE_SECONDS to
+# catch anything missed.
+MONITOR_MODE = os.getenv("MONITOR_MODE", "poll").strip().lower()
+SOLANA_WS_URL = os.getenv("SOLANA_WS_URL", "").strip() or re.sub(
+    r"^http", "ws", SOLANA_RPC_URLS.split(",")[0].split(";")[0].strip()
+)
+WS_SUBSCRIPTIONS_PER_CONNECTION = int(os.getenv("WS_SUBSCRIPTIONS_PER_CONNECTION", "1000"))
+WS_RECONCILE_SECONDS = int(os.getenv("WS_RECONCILE_SECONDS", "300"))
+# Blocks mode: how often to look for new slots, how many blocks to fetch at once, and how
+# far behind the tip to fall before skipping ahead (and reconciling by scan instead).
+BLOCK_POLL_SECONDS = float(os.getenv("BLOCK_POLL_SECONDS", "1"))
+BLOCK_FETCH_CONCURRENCY = int(os.getenv("BLOCK_FETCH_CONCURRENCY", "4"))
+BLOCK_MAX_LAG_SLOTS = int(os.getenv("BLOCK_MAX_LAG_SLOTS", "150"))
 
 # =========================
 # Conversation states
@@ -53,146 +168,2014 @@ CB_HELP = "help"
 CB_WALLETS_PAGE_PREFIX = "wpage:"     # wpage:<n>
 CB_TOGGLE_PREFIX = "toggle:"          # toggle:<wallet_id>
 CB_DELETE_PREFIX = "delete:"          # delete:<wallet_id>
+CB_ALERT_GROUPING = "alert_grouping"
 
 # =========================
-# Address validation (rough)
+# Addresses (base58 public keys)
 # =========================
-BASE58_RE = re.compile(r"^[1-9A-HJ-NP-Za-km-z]{32,44}$")
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+
+def b58encode(raw: bytes) -> str:
+    n = int.from_bytes(raw, "big")
+    out = []
+    while n:
+        n, r = divmod(n, 58)
+        out.append(B58_ALPHABET[r])
+    pad = len(raw) - len(raw.lstrip(b"\0"))
+    return "1" * pad + "".join(reversed(out))
+
+def b58decode(text: str) -> bytes:
+    n = 0
+    for c in text:
+        i = _B58_INDEX.get(c)
+        if i is None:
+            raise ValueError(f"invalid base58 character {c!r}")
+        n = n * 58 + i
+    pad = len(text) - len(text.lstrip("1"))
+    return b"\0" * pad + n.to_bytes((n.bit_length() + 7) // 8, "big")
+
+def decode_address(addr: str) -> bytes:
+    """
+    The 32-byte public key `addr` encodes; ValueError if it is not one.
+    """
+    addr = addr.strip()
+    if not 32 <= len(addr) <= 44:
+        raise ValueError("a Solana address is 32-44 base58 characters")
+    raw = b58decode(addr)
+    if len(raw) != 32:
+        raise ValueError(f"decodes to {len(raw)} bytes, not 32")
+    return raw
+
+@functools.lru_cache(maxsize=4096)
+def address_text(key: bytes) -> str:
+    """
+    b58encode for the screens, which show the same user's wallets on every view.
+    """
+    return b58encode(key)
+
+def is_solana_address(addr: str) -> bool:
+    try:
+        decode_address(addr)
+        return True
+    except ValueError:
+        return False
 
-def is_probably_solana_address(addr: str) -> bool:
-    return bool(BASE58_RE.match(addr.strip()))
+# =========================
+# Metrics (Prometheus text exposition)
+# =========================
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = []
+    for n, v in zip(names, values):
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{n}="{v}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        METRICS.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    le = _label_str(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _label_str(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, key)} {count}")
+        return lines
+
+METRICS: List[Metric] = []
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+M_SCAN_DURATION = Histogram("sniffer_scan_duration_seconds", "Wall time of one scan batch (wheel tick or full pass)")
+M_SCAN_WALLETS = Gauge("sniffer_scan_wallets", "Enabled wallets being tracked")
+M_SCAN_ADDRESSES = Gauge("sniffer_scan_addresses", "Distinct addresses in the last scan batch")
+M_WALLETS_SCANNED = Counter("sniffer_wallets_scanned_total", "Wallets covered by scan passes")
+M_RPC_LATENCY = Histogram("sniffer_rpc_latency_seconds", "Caller-observed RPC call latency", ("method", "status"))
+M_RPC_CALLS = Counter("sniffer_rpc_calls_total", "RPC calls by method and outcome", ("method", "status"))
+M_RPC_HTTP_LATENCY = Histogram("sniffer_rpc_http_latency_seconds", "Latency of RPC HTTP round trips", ("endpoint", "status"))
+M_RPC_ENDPOINT_LATENCY = Gauge("sniffer_rpc_endpoint_latency_ewma_seconds", "Smoothed round-trip latency per endpoint", ("endpoint",))
+M_RPC_ENDPOINT_ERROR_RATE = Gauge("sniffer_rpc_endpoint_error_rate_ewma", "Smoothed failure rate per endpoint", ("endpoint",))
+M_RPC_ENDPOINT_UP = Gauge("sniffer_rpc_endpoint_up", "1 while an endpoint's circuit breaker is closed, 0 while open", ("endpoint",))
+M_RPC_ERRORS = Counter("sniffer_rpc_errors_total", "Failed RPC calls by method and outcome", ("method", "status"))
+M_SCAN_LAG = Gauge("sniffer_scan_lag_seconds", "How far the stalest enabled address is behind its scan interval")
+M_SCAN_BACKLOG = Gauge("sniffer_scan_backlog_addresses", "Due addresses carried over because a batch ran out of budget")
+M_SCAN_FAILURES = Counter("sniffer_scan_failed_addresses_total", "Address fetches that failed, by cause", ("status",))
+M_ADDRESS_BACKOFF = Gauge("sniffer_scan_backoff_addresses", "Addresses held back after repeated fetch failures")
+M_BLOCKS = Counter("sniffer_blocks_total", "Slots handled by the block watcher", ("result",))
+M_BLOCK_LAG = Gauge("sniffer_block_lag_slots", "Confirmed slots the block watcher has not read yet")
+M_BLOCK_MATCHES = Counter("sniffer_block_matched_addresses_total", "Watched addresses found in blocks")
+M_POLL_TIERS = Gauge("sniffer_poll_tier_addresses", "Tracked addresses per adaptive polling tier", ("tier",))
+M_SEMAPHORE_WAIT = Histogram("sniffer_rpc_semaphore_wait_seconds", "Time scan fetches wait for a concurrency slot")
+M_RPC_QUOTA_WAIT = Histogram("sniffer_rpc_quota_wait_seconds", "Time RPC requests wait for the client-side quota")
+M_RPC_HEDGES = Counter("sniffer_rpc_hedges_total", "Hedged RPC requests by outcome (won = the hedge answered first)", ("result",))
+M_RPC_THROTTLED = Counter("sniffer_rpc_throttled_total", "HTTP 429 responses per endpoint", ("endpoint",))
+M_RPC_CONCURRENCY_LIMIT = Gauge("sniffer_rpc_concurrency_limit", "Current adaptive limit on concurrent scan fetches")
+M_RPC_CONCURRENCY_INFLIGHT = Gauge("sniffer_rpc_concurrency_inflight", "Scan fetches currently holding a concurrency slot")
+M_ALERTS = Counter("sniffer_alerts_total", "Outbound alerts by result", ("result",))
+M_ALERT_QUEUE = Gauge("sniffer_alert_queue_depth", "Alerts waiting in the outbound queue")
+M_TELEGRAM_LATENCY = Histogram("sniffer_telegram_send_seconds", "Latency of bot.send_message", ("status",))
+M_DB_LATENCY = Histogram("sniffer_db_op_seconds", "Latency of db_* operations", ("op",))
+M_HANDLER_LATENCY = Histogram("sniffer_handler_seconds", "Telegram update handler latency", ("handler",))
+M_LOOP_LAG = Gauge("sniffer_event_loop_lag_seconds", "Event loop lag over the last report window", ("stat",))
+
+def rpc_status(e: Optional[BaseException]) -> str:
+    if e is None:
+        return "ok"
+    if isinstance(e, RpcUnavailable):
+        return "unavailable"
+    if isinstance(e, RpcHttpError):
+        return f"http_{e.status}"
+    if isinstance(e, RpcError):
+        return f"rpc_{e.code}" if e.code is not None else "rpc_error"
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    return type(e).__name__
+
+def timed_db(fn: Callable[..., T]) -> Callable[..., T]:
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        with M_DB_LATENCY.time(op=fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def timed_handler(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        t0 = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            M_HANDLER_LATENCY.observe(time.perf_counter() - t0, handler=fn.__name__)
+    return wrapper
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    async def handle(_request: web.Request) -> web.Response:
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    metrics_app = web.Application()
+    metrics_app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(metrics_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+# =========================
+# In-memory wallet registry
+# =========================
+# array('Q') value for "not known yet" (no balance or slot read so far).
+NO_VALUE = 2 ** 64 - 1
+
+class WalletRegistry:
+    """
+    Enabled wallets and the last known balance of every address they watch, loaded once at
+    startup and kept current by the db_* write helpers after each commit, so scans never
+    re-read the tables. Mutated from DB threads, read from the event loop: guarded by a lock.
+
+    Stored as parallel arrays instead of an object per wallet. Each wallet has a dense
+    index into _wallet_ids / _user_ids / _wallet_addr / _next, each address one into
+    _texts / _keys / _lamports / _slots / _head / _counts; an address's wallets form a
+    chain through _head and _next. Lookups go by the base58 text every RPC response
+    carries, database writes by the 32-byte key. Wallet names stay in the database and
+    are read only for wallets that changed (db_get_wallet_names). Freed indexes are reused.
+    """
+
+    # Address membership changes kept for changes_since(); a reader further behind resyncs.
+    CHANGE_LOG_MAX = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._per_wallet_alert_users: Set[int] = set()
+        # Bumped on every membership change (not on balance updates).
+        self.version = 0
+        # (version, address, added) for each address that appeared or went away; every
+        # change after version _log_floor is in it.
+        self._log: Deque[Tuple[int, str, bool]] = collections.deque()
+        self._log_floor = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        # per wallet
+        self._wallet_ids = array("q")    # -1 when free
+        self._user_ids = array("q")      # Telegram ids do not fit in 32 bits
+        self._wallet_addr = array("i")   # address index
+        self._next = array("i")          # next wallet on the same address, -1 at the end
+        self._free_wallets: List[int] = []
+        # per address
+        self._texts: List[Optional[str]] = []   # None when free
+        self._keys: List[Optional[bytes]] = []  # the addresses table's key, None when free
+        self._index: Dict[str, int] = {}
+        self._lamports = array("Q")
+        self._slots = array("Q")
+        self._head = array("i")
+        self._counts = array("I")
+        self._free_addresses: List[int] = []
+        self._wallets = 0
+
+    def __len__(self) -> int:
+        return self._wallets
+
+    def load(self, rows: List[Tuple[Any, ...]]) -> None:
+        """
+        rows: (wallet_id, user_id, name, address, last_lamports[, last_slot[, key]]);
+        the key is decoded from the address when missing.
+        """
+        with self._lock:
+            self._reset()
+            for row in rows:
+                wallet_id, user_id, _name, address, last_lamports = row[:5]
+                key = row[6] if len(row) > 6 else decode_address(address)
+                self._put(wallet_id, user_id, address, key, last_lamports, row[5] if len(row) > 5 else None)
+            self.version += 1
+            self._log.clear()
+            self._log_floor = self.version
+
+    def _put(
+        self,
+        wallet_id: int,
+        user_id: int,
+        address: str,
+        key: bytes,
+        last_lamports: Optional[int],
+        last_slot: Optional[int],
+    ) -> bool:
+        """
+        Returns whether the address is new.
+        """
+        a = self._index.get(address)
+        new = a is None
+        if a is None:
+            lamports = NO_VALUE if last_lamports is None else last_lamports
+            slot = NO_VALUE if last_slot is None else last_slot
+            if self._free_addresses:
+                a = self._free_addresses.pop()
+                self._texts[a], self._keys[a] = address, key
+                self._lamports[a], self._slots[a], self._head[a], self._counts[a] = lamports, slot, -1, 0
+            else:
+                a = len(self._texts)
+                self._texts.append(address)
+                self._keys.append(key)
+                self._lamports.append(lamports)
+                self._slots.append(slot)
+                self._head.append(-1)
+                self._counts.append(0)
+            self._index[address] = a
+
+        if self._free_wallets:
+            w = self._free_wallets.pop()
+            self._wallet_ids[w], self._user_ids[w], self._wallet_addr[w] = wallet_id, user_id, a
+            self._next[w] = self._head[a]
+        else:
+            w = len(self._wallet_ids)
+            self._wallet_ids.append(wallet_id)
+            self._user_ids.append(user_id)
+            self._wallet_addr.append(a)
+            self._next.append(self._head[a])
+        self._head[a] = w
+        self._counts[a] += 1
+        self._wallets += 1
+        return new
+
+    def _logged(self, address: str, added: bool) -> None:
+        # Called with the version about to be published.
+        if len(self._log) >= self.CHANGE_LOG_MAX:
+            self._log_floor = self._log.popleft()[0]
+        self._log.append((self.version + 1, address, added))
+
+    def add(
+        self,
+        wallet_id: int,
+        user_id: int,
+        address: str,
+        last_lamports: Optional[int],
+        last_slot: Optional[int] = None,
+        key: Optional[bytes] = None,
+    ) -> None:
+        if key is None:
+            key = decode_address(address)
+        with self._lock:
+            if self._put(wallet_id, user_id, address, key, last_lamports, last_slot):
+                self._logged(address, True)
+            self.version += 1
+
+    def _find_wallet(self, wallet_id: int) -> int:
+        # Membership changes are rare next to scans, so a linear search in C beats
+        # keeping a wallet_id -> index dict alive for every wallet.
+        try:
+            return self._wallet_ids.index(wallet_id)
+        except ValueError:
+            return -1
+
+    def remove(self, wallet_id: int) -> None:
+        with self._lock:
+            w = self._find_wallet(wallet_id)
+            if w < 0:
+                return
+            a = self._wallet_addr[w]
+            if self._head[a] == w:
+                self._head[a] = self._next[w]
+            else:
+                prev = self._head[a]
+                while self._next[prev] != w:
+                    prev = self._next[prev]
+                self._next[prev] = self._next[w]
+            self._wallet_ids[w] = -1
+            self._free_wallets.append(w)
+            self._wallets -= 1
+            self._counts[a] -= 1
+            if self._counts[a] == 0:
+                self._logged(self._texts[a], False)
+                del self._index[self._texts[a]]
+                self._texts[a] = self._keys[a] = None
+                self._free_addresses.append(a)
+            self.version += 1
+
+    def changes_since(self, version: int) -> Tuple[int, Optional[List[Tuple[str, bool]]]]:
+        """
+        Addresses that appeared (True) or went away (False) after `version`, oldest first,
+        so a reader can follow membership without copying every address.
+        Returns: (current version, changes), changes None when the log no longer reaches
+        back that far (or across a load) and the reader must resync from addresses().
+        """
+        with self._lock:
+            if version < self._log_floor:
+                return self.version, None
+            changes: List[Tuple[str, bool]] = []
+            for logged, address, added in reversed(self._log):
+                if logged <= version:
+                    break
+                changes.append((address, added))
+            changes.reverse()
+            return self.version, changes
+
+    def watched(self, addresses: Any) -> Set[str]:
+        """
+        The subset of `addresses` that someone is watching (one lock round trip).
+        """
+        with self._lock:
+            return {a for a in addresses if a in self._index}
+
+    def diff(
+        self,
+        addresses: List[str],
+        balances: List[int],
+        slots: Optional[List[int]] = None,
+        min_delta: int = ALERT_MIN_LAMPORTS,
+    ) -> Tuple[int, List[Tuple[str, int, Optional[int]]], List[Tuple[int, int, str, int, int]]]:
+        """
+        Compares fetched `balances` (read at `slots`, one per balance, or None for a batch
+        whose source reports no slot; the vectorized path takes no None entries) with the
+        held ones in one lock round trip; unchanged addresses only touch the arrays. A
+        read from an older slot than the held one (e.g. a finalized scan racing a confirmed
+        push) is ignored, an address's first balance is new but not a change, and a change
+        smaller than `min_delta` is neither.
+        Returns: (wallets covered, new [(address, lamports, slot)],
+                  changed [(wallet_id, user_id, address, last, current)])
+        """
+        with self._lock:
+            if np is not None and len(addresses) >= VECTORIZE_MIN_BATCH:
+                wallets, new, hits = self._diff_vectorized(addresses, balances, slots, min_delta)
+            else:
+                wallets, new, hits = self._diff_loop(addresses, balances, slots, min_delta)
+
+            # Only changed addresses get this far: one row per subscribed wallet.
+            changed: List[Tuple[int, int, str, int, int]] = []
+            for a, address, last, current in hits:
+                w = self._head[a]
+                while w >= 0:
+                    changed.append((self._wallet_ids[w], self._user_ids[w], address, last, current))
+                    w = self._next[w]
+        return wallets, new, changed
+
+    def _diff_loop(
+        self,
+        addresses: List[str],
+        balances: List[int],
+        slots: Optional[List[int]],
+        min_delta: int,
+    ) -> Tuple[int, List[Tuple[str, int, Optional[int]]], List[Tuple[int, str, int, int]]]:
+        index, lamports, held_slots, counts = self._index, self._lamports, self._slots, self._counts
+        wallets = 0
+        new: List[Tuple[str, int, Optional[int]]] = []
+        hits: List[Tuple[int, str, int, int]] = []   # (address index, address, last, current)
+        for address, current, slot in zip(addresses, balances, slots or itertools.repeat(None)):
+            a = index.get(address)
+            if a is None:
+                continue
+            wallets += counts[a]
+            last = lamports[a]
+            if last == current:
+                continue
+            held_slot = held_slots[a]
+            if slot is not None and held_slot != NO_VALUE and slot < held_slot:
+                continue
+            if last == NO_VALUE:
+                new.append((address, current, slot))
+                continue
+            if abs(current - last) < min_delta:
+                continue
+            new.append((address, current, slot))
+            hits.append((a, address, last, current))
+        return wallets, new, hits
+
+    def _diff_vectorized(
+        self,
+        addresses: List[str],
+        balances: List[int],
+        slots: Optional[List[int]],
+        min_delta: int,
+    ) -> Tuple[int, List[Tuple[str, int, Optional[int]]], List[Tuple[int, str, int, int]]]:
+        """
+        _diff_loop over uint64 arrays: gathers the held balances for the whole batch, and
+        only the positions np.flatnonzero picks out come back as Python objects.
+        """
+        index = self._index
+        ix = np.array(list(map(index.get, addresses, itertools.repeat(-1, len(addresses)))), dtype=np.int64)
+        pos = np.flatnonzero(ix >= 0)
+        if not len(pos):
+            return 0, [], []
+        ix = ix[pos]
+        current = np.array(balances, dtype=np.uint64)[pos]
+
+        # Views over the registry's buffers. An array can't grow while exported, so they
+        # go before the lock is released; the fancy-indexed results are copies.
+        lamports = np.frombuffer(self._lamports, dtype=np.uint64)
+        held_slots = np.frombuffer(self._slots, dtype=np.uint64)
+        counts = np.frombuffer(self._counts, dtype=np.uint32)
+        last, held_slot, wallets = lamports[ix], held_slots[ix], int(counts[ix].sum())
+        del lamports, held_slots, counts
+
+        news = current != last
+        read_slot = None
+        if slots is not None:
+            read_slot = np.array(slots, dtype=np.uint64)[pos]
+            news &= (held_slot == NO_VALUE) | (held_slot <= read_slot)
+        first = last == NO_VALUE
+        if min_delta > 0:
+            delta = np.abs(current.astype(np.int64) - last.astype(np.int64))
+            news &= first | (delta >= min_delta)
+
+        picked = np.flatnonzero(news)
+        new: List[Tuple[str, int, Optional[int]]] = []
+        hits: List[Tuple[int, str, int, int]] = []
+        for p, a, last_lamports, lamports_now, is_first, slot in zip(
+            pos[picked].tolist(), ix[picked].tolist(), last[picked].tolist(),
+            current[picked].tolist(), first[picked].tolist(),
+            itertools.repeat(None) if read_slot is None else read_slot[picked].tolist(),
+        ):
+            address = addresses[p]
+            new.append((address, lamports_now, slot))
+            if not is_first:
+                hits.append((a, address, last_lamports, lamports_now))
+        return wallets, new, hits
+
+    def set_balances(self, updates: List[Tuple[str, int, Optional[int]]]) -> None:
+        """
+        updates: (address, lamports, slot). A read from an older slot than the one already
+        held is dropped; slot None always applies and keeps the held slot.
+        """
+        with self._lock:
+            for address, lamports, slot in updates:
+                a = self._index.get(address)
+                if a is None:
+                    continue
+                if slot is None:
+                    self._lamports[a] = lamports
+                elif self._slots[a] == NO_VALUE or slot >= self._slots[a]:
+                    self._lamports[a] = lamports
+                    self._slots[a] = slot
+
+    def addresses(self) -> List[str]:
+        with self._lock:
+            return list(self._index)
+
+    def keys(self, addresses: List[str]) -> List[Optional[bytes]]:
+        """
+        The 32-byte key of each of `addresses`, None for those not tracked.
+        """
+        with self._lock:
+            index, keys = self._index, self._keys
+            out: List[Optional[bytes]] = []
+            for address in addresses:
+                a = index.get(address)
+                out.append(None if a is None else keys[a])
+            return out
+
+    def balance(self, address: str) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Returns: (last_lamports, last_slot) for `address`, (None, None) if not tracked
+        """
+        with self._lock:
+            a = self._index.get(address)
+            if a is None:
+                return None, None
+            lamports, slot = self._lamports[a], self._slots[a]
+            return (None if lamports == NO_VALUE else lamports), (None if slot == NO_VALUE else slot)
+
+    def load_alert_preferences(self, per_wallet_users: List[int]) -> None:
+        with self._lock:
+            self._per_wallet_alert_users = set(per_wallet_users)
+
+    def set_per_wallet_alerts(self, user_id: int, enabled: bool) -> None:
+        with self._lock:
+            if enabled:
+                self._per_wallet_alert_users.add(user_id)
+            else:
+                self._per_wallet_alert_users.discard(user_id)
+
+    def per_wallet_alerts(self, user_id: int) -> bool:
+        return user_id in self._per_wallet_alert_users
+
+REGISTRY = WalletRegistry()
 
 # =========================
 # Database helpers (SQLite)
 # =========================
-def db_connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
-    return conn
+class ConnectionPool:
+    """
+    Long-lived SQLite connections: one writer (serialized by a lock) and DB_READERS readers.
+    Pragmas are applied once per connection, and each connection's statement cache keeps
+    prepared statements alive between calls.
+    """
 
+    def __init__(self, path: str, readers: int = DB_READERS):
+        self.path = path
+        self._writer = self._open()
+        self._writer_lock = threading.Lock()
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._all = [self._writer]
+        for _ in range(max(1, readers)):
+            conn = self._open()
+            self._all.append(conn)
+            self._readers.put(conn)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Commits on success, rolls back if the block raises.
+        """
+        with self._writer_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self) -> None:
+        for conn in self._all:
+            conn.close()
+
+_db_pool: Optional[ConnectionPool] = None
+_db_pool_lock = threading.Lock()
+
+def db_pool() -> ConnectionPool:
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(DB_PATH)
+    return _db_pool
+
+def db_close() -> None:
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.close()
+            _db_pool = None
+
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    """
+    Balances live once per distinct address; subscriptions say who watches which address.
+    An old per-wallet table is split: subscriptions keep their wallet ids (inline buttons
+    already sent still carry them), and an address shared by several wallets takes the
+    balance of an enabled one, since disabled wallets stopped being refreshed.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS addresses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            address TEXT NOT NULL UNIQUE,
+            last_lamports INTEGER,
+            last_slot INTEGER
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            address_id INTEGER NOT NULL REFERENCES addresses(id),
+            name TEXT NOT NULL,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            UNIQUE(user_id, address_id)
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_address_id ON subscriptions(address_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_enabled ON subscriptions(enabled);")
+
+    has_wallets = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wallets'"
+    ).fetchone()
+    if not has_wallets:
+        return
+    conn.execute("""
+        INSERT INTO addresses (address, last_lamports)
+        SELECT w.address, (
+            SELECT last_lamports FROM wallets
+            WHERE address = w.address
+            ORDER BY enabled DESC, last_lamports IS NULL, id DESC
+            LIMIT 1
+        )
+        FROM wallets w
+        GROUP BY w.address
+    """)
+    conn.execute("""
+        INSERT INTO subscriptions (id, user_id, address_id, name, enabled)
+        SELECT w.id, w.user_id, a.id, w.name, w.enabled
+        FROM wallets w JOIN addresses a ON a.address = w.address
+    """)
+    conn.execute("DROP TABLE wallets")
+    logger.info("Migrated wallets table to addresses + subscriptions")
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    """
+    Addresses become their 32-byte public keys (BLOB) instead of 32-44 characters of
+    base58, which roughly halves the table and its unique index. Rows saved before input
+    was decoded, that are not a public key, never scanned successfully; they are dropped
+    along with their subscriptions.
+    """
+    conn.execute("""
+        CREATE TABLE addresses_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            address BLOB NOT NULL UNIQUE CHECK (length(address) = 32),
+            last_lamports INTEGER,
+            last_slot INTEGER
+        );
+    """)
+    rows = []
+    invalid = []
+    for address_id, address, last_lamports, last_slot in conn.execute(
+        "SELECT id, address, last_lamports, last_slot FROM addresses"
+    ).fetchall():
+        try:
+            rows.append((address_id, decode_address(address), last_lamports, last_slot))
+        except ValueError as e:
+            logger.warning("Dropping stored address %r: %s", address, e)
+            invalid.append((address_id,))
+    conn.executemany("INSERT INTO addresses_v2 (id, address, last_lamports, last_slot) VALUES (?, ?, ?, ?)", rows)
+    conn.executemany("DELETE FROM subscriptions WHERE address_id = ?", invalid)
+    conn.execute("DROP TABLE addresses")
+    conn.execute("ALTER TABLE addresses_v2 RENAME TO addresses")
+
+# _MIGRATIONS[n] takes the schema from PRAGMA user_version n to n + 1.
+_MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [_migrate_v1, _migrate_v2]
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+@timed_db
 def db_init() -> None:
-    conn = db_connect()
-    try:
+    with db_pool().writer() as conn:
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS wallets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                address TEXT NOT NULL,
-                enabled INTEGER NOT NULL DEFAULT 1,
-                last_lamports INTEGER,
-                UNIQUE(user_id, address)
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id INTEGER PRIMARY KEY,
+                alert_per_wallet INTEGER NOT NULL DEFAULT 0
             );
         """)
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_wallets_user_id ON wallets(user_id);")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_wallets_enabled ON wallets(enabled);")
-        conn.commit()
-    finally:
-        conn.close()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
 
+        # One transaction for every pending step: a crash halfway leaves the old schema.
+        conn.execute("BEGIN IMMEDIATE")
+        for migrate in _MIGRATIONS[version:]:
+            migrate(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+# Wallet rows as the screens see them: one per subscription, balance from its address.
+_WALLET_COLUMNS = "s.id, s.name, a.address, s.enabled, a.last_lamports"
+_WALLET_JOIN = "subscriptions s JOIN addresses a ON a.id = s.address_id"
+
+@timed_db
 def db_add_wallet(user_id: int, name: str, address: str) -> Tuple[bool, str]:
-    conn = db_connect()
     try:
-        try:
-            conn.execute(
-                "INSERT INTO wallets (user_id, name, address, enabled, last_lamports) VALUES (?, ?, ?, 1, NULL)",
-                (user_id, name, address),
+        key = decode_address(address)
+    except ValueError:
+        return False, "⚠️ That doesn’t look like a valid Solana address."
+    address = b58encode(key)
+    try:
+        with db_pool().writer() as conn:
+            conn.execute("INSERT OR IGNORE INTO addresses (address) VALUES (?)", (key,))
+            address_id, last_lamports, last_slot = conn.execute(
+                "SELECT id, last_lamports, last_slot FROM addresses WHERE address = ?",
+                (key,),
+            ).fetchone()
+            cur = conn.execute(
+                "INSERT INTO subscriptions (user_id, address_id, name, enabled) VALUES (?, ?, ?, 1)",
+                (user_id, address_id, name),
             )
-            conn.commit()
-            return True, "✅ Wallet saved!"
-        except sqlite3.IntegrityError:
-            return False, "⚠️ That wallet address is already saved for you."
-    finally:
-        conn.close()
+        REGISTRY.add(cur.lastrowid, user_id, address, last_lamports, last_slot, key)
+        return True, "✅ Wallet saved!"
+    except sqlite3.IntegrityError:
+        return False, "⚠️ That wallet address is already saved for you."
 
+@timed_db
 def db_get_wallets(user_id: int) -> List[Tuple[int, str, str, int, Optional[int]]]:
-    conn = db_connect()
-    try:
+    with db_pool().reader() as conn:
         cur = conn.execute(
-            "SELECT id, name, address, enabled, last_lamports FROM wallets WHERE user_id = ? ORDER BY id DESC",
+            f"SELECT {_WALLET_COLUMNS} FROM {_WALLET_JOIN} WHERE s.user_id = ? ORDER BY s.id DESC",
             (user_id,),
         )
-        return cur.fetchall()
-    finally:
-        conn.close()
+        return [(i, name, address_text(a), enabled, last) for i, name, a, enabled, last in cur.fetchall()]
 
+@timed_db
 def db_toggle_wallet(user_id: int, wallet_id: int) -> Optional[int]:
-    conn = db_connect()
-    try:
+    with db_pool().writer() as conn:
         cur = conn.execute(
-            "SELECT enabled FROM wallets WHERE id = ? AND user_id = ?",
+            f"SELECT s.enabled, a.address, a.last_lamports, a.last_slot FROM {_WALLET_JOIN} "
+            "WHERE s.id = ? AND s.user_id = ?",
             (wallet_id, user_id),
         )
         row = cur.fetchone()
         if not row:
             return None
-        enabled = int(row[0])
-        new_enabled = 0 if enabled == 1 else 1
+        enabled, key, last_lamports, last_slot = row
+        address = address_text(key)
+        new_enabled = 0 if int(enabled) == 1 else 1
         conn.execute(
-            "UPDATE wallets SET enabled = ? WHERE id = ? AND user_id = ?",
+            "UPDATE subscriptions SET enabled = ? WHERE id = ? AND user_id = ?",
             (new_enabled, wallet_id, user_id),
         )
-        conn.commit()
-        return new_enabled
-    finally:
-        conn.close()
 
+    if new_enabled == 1:
+        REGISTRY.add(wallet_id, user_id, address, last_lamports, last_slot, key)
+    else:
+        REGISTRY.remove(wallet_id)
+    return new_enabled
+
+@timed_db
 def db_delete_wallet(user_id: int, wallet_id: int) -> bool:
-    conn = db_connect()
-    try:
-        cur = conn.execute(
-            "DELETE FROM wallets WHERE id = ? AND user_id = ?",
+    with db_pool().writer() as conn:
+        row = conn.execute(
+            "SELECT address_id FROM subscriptions WHERE id = ? AND user_id = ?",
             (wallet_id, user_id),
+        ).fetchone()
+        if row is None:
+            return False
+        conn.execute("DELETE FROM subscriptions WHERE id = ?", (wallet_id,))
+        # Nobody else subscribed: the address row has nothing left to serve.
+        conn.execute(
+            "DELETE FROM addresses WHERE id = ? AND NOT EXISTS (SELECT 1 FROM subscriptions WHERE address_id = ?)",
+            (row[0], row[0]),
         )
-        conn.commit()
-        return cur.rowcount > 0
-    finally:
-        conn.close()
+    REGISTRY.remove(wallet_id)
+    return True
 
-def db_get_enabled_wallets_all_users() -> List[Tuple[int, int, str, str, Optional[int]]]:
+@timed_db
+def db_get_enabled_wallets_all_users() -> List[Tuple[int, int, str, str, Optional[int], Optional[int], bytes]]:
     """
-    Returns: (wallet_id, user_id, name, address, last_lamports)
+    Returns: (wallet_id, user_id, name, address, last_lamports, last_slot, key)
+    Only used to load REGISTRY at startup; scans read the registry.
     """
-    conn = db_connect()
-    try:
+    with db_pool().reader() as conn:
         cur = conn.execute(
-            "SELECT id, user_id, name, address, last_lamports FROM wallets WHERE enabled = 1"
+            "SELECT s.id, s.user_id, s.name, a.address, a.last_lamports, a.last_slot "
+            f"FROM {_WALLET_JOIN} WHERE s.enabled = 1"
         )
-        return cur.fetchall()
-    finally:
-        conn.close()
-
-def db_update_last_lamports(wallet_id: int, lamports: int) -> None:
-    conn = db_connect()
-    try:
+        # Encoded once per address: wallets sharing one also share its str and key.
+        texts: Dict[bytes, Tuple[str, bytes]] = {}
+        rows = []
+        for i, user_id, name, key, last, slot in cur:
+            interned = texts.get(key)
+            if interned is None:
+                interned = texts[key] = (b58encode(key), key)
+            rows.append((i, user_id, name, interned[0], last, slot, interned[1]))
+        return rows
+
+@timed_db
+def db_get_wallet_names(wallet_ids: List[int]) -> Dict[int, str]:
+    names: Dict[int, str] = {}
+    with db_pool().reader() as conn:
+        for i in range(0, len(wallet_ids), DB_WRITE_CHUNK):
+            chunk = wallet_ids[i:i + DB_WRITE_CHUNK]
+            cur = conn.execute(
+                f"SELECT id, name FROM subscriptions WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            names.update(cur.fetchall())
+    return names
+
+@timed_db
+def db_get_per_wallet_alert_users() -> List[int]:
+    with db_pool().reader() as conn:
+        cur = conn.execute("SELECT user_id FROM user_settings WHERE alert_per_wallet = 1")
+        return [r[0] for r in cur.fetchall()]
+
+@timed_db
+def db_set_per_wallet_alerts(user_id: int, enabled: bool) -> None:
+    with db_pool().writer() as conn:
         conn.execute(
-            "UPDATE wallets SET last_lamports = ? WHERE id = ?",
-            (lamports, wallet_id),
+            "INSERT INTO user_settings (user_id, alert_per_wallet) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET alert_per_wallet = excluded.alert_per_wallet",
+            (user_id, 1 if enabled else 0),
         )
-        conn.commit()
-    finally:
-        conn.close()
+    REGISTRY.set_per_wallet_alerts(user_id, enabled)
+
+@timed_db
+def db_update_balances_many(updates: List[Tuple[str, int, Optional[int]]]) -> None:
+    """
+    Writes (address, lamports, slot) rows in one transaction, DB_WRITE_CHUNK rows per
+    executemany. Either every row is committed or none is. A row read at an older slot
+    than the stored one is skipped; slot None keeps the stored slot.
+    """
+    # Tracked addresses carry their key; only one untracked since the fetch is decoded.
+    keys = REGISTRY.keys([address for address, _lamports, _slot in updates])
+    rows = [
+        (lamports, slot, key if key is not None else decode_address(address))
+        for (address, lamports, slot), key in zip(updates, keys)
+    ]
+    with db_pool().writer() as conn:
+        for i in range(0, len(rows), DB_WRITE_CHUNK):
+            conn.executemany(
+                "UPDATE addresses SET last_lamports = ?1, last_slot = COALESCE(?2, last_slot) "
+                "WHERE address = ?3 AND (?2 IS NULL OR last_slot IS NULL OR last_slot <= ?2)",
+                rows[i:i + DB_WRITE_CHUNK],
+            )
+    REGISTRY.set_balances(updates)
+
+# SQLite calls block on disk I/O, so async code runs them on dedicated DB threads.
+# Writers still serialize on the pool's writer lock; readers run in parallel.
+_db_executor = ThreadPoolExecutor(max_workers=DB_READERS + 1, thread_name_prefix="sqlite")
+
+async def db_call(fn: Callable[..., T], *args: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, fn, *args)
+
+# =========================
+# Rate limiting
+# =========================
+class TokenBucket:
+    """
+    `rate` tokens per second up to `burst`. `delay()` says how long until a token is
+    available (including any pause imposed by a Retry-After); `take()` spends one.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_take = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return wait
+
+    def take(self, cost: float = 1.0) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= cost
+        self.last_take = now
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that finds its own level (additive increase, multiplicative decrease).
+    Used like a semaphore; the calls that should steer it run under `sample()`:
+
+        async with limiter:
+            with limiter.sample():
+                await fetch()
+
+    Each healthy sample while the limit is in use adds 1/limit (so +1 per round of
+    responses). A 429, 5xx, timeout or connection failure halves it, and so does smoothed
+    latency rising above RPC_LATENCY_TOLERANCE x its own minimum over the last minute or
+    so (queueing at the provider shows up as latency before it shows up as errors).
+    Decreases are spaced a couple of round trips apart so one bad burst counts once.
+    JSON-RPC errors are neutral.
+    """
+
+    ALPHA = 0.2
+    BASELINE_WINDOW_SECONDS = 30.0
+
+    def __init__(
+        self,
+        initial: int = RPC_CONCURRENCY_INITIAL,
+        minimum: int = RPC_CONCURRENCY_MIN,
+        maximum: int = RPC_CONCURRENCY_MAX,
+        tolerance: float = RPC_LATENCY_TOLERANCE,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.tolerance = tolerance
+        self.inflight = 0
+        self.latency: Optional[float] = None     # EWMA of healthy response times
+        self.baseline: Optional[float] = None    # lowest EWMA over the last 1-2 windows
+        self._window_min: Optional[float] = None
+        self._previous_min: Optional[float] = None
+        self._window_started = time.monotonic()
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._last_decrease = 0.0
+        M_RPC_CONCURRENCY_LIMIT.set(self.limit)
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self.release()
+
+    async def acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            M_RPC_CONCURRENCY_INFLIGHT.set(self.inflight)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                # Granted a slot just as we were cancelled: hand it on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.inflight += 1
+                fut.set_result(None)
+        M_RPC_CONCURRENCY_INFLIGHT.set(self.inflight)
+
+    @contextmanager
+    def sample(self) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.observe(time.perf_counter() - t0, e)
+            raise
+        self.observe(time.perf_counter() - t0)
+
+    def observe(self, seconds: float, error: Optional[BaseException] = None) -> None:
+        if error is not None:
+            if self._overloaded(error):
+                self._decrease()
+            return
+        self.latency = seconds if self.latency is None else self.latency + self.ALPHA * (seconds - self.latency)
+        self._update_baseline()
+        if self.latency > self.tolerance * max(self.baseline, 0.025):
+            self._decrease()
+        elif self.inflight + len(self._waiters) >= int(self.limit):
+            # Only grow while the limit is what holds callers back.
+            self._set_limit(self.limit + 1.0 / self.limit)
+
+    def _update_baseline(self) -> None:
+        now = time.monotonic()
+        if now - self._window_started >= self.BASELINE_WINDOW_SECONDS:
+            self._previous_min, self._window_min = self._window_min, None
+            self._window_started = now
+        if self._window_min is None or self.latency < self._window_min:
+            self._window_min = self.latency
+        self.baseline = min(m for m in (self._window_min, self._previous_min) if m is not None)
+
+    @staticmethod
+    def _overloaded(error: BaseException) -> bool:
+        if isinstance(error, RpcHttpError):
+            return error.status == 429 or error.status >= 500
+        return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # Give the smoothed latency a couple of round trips to reflect the lower limit.
+        if now - self._last_decrease < max(2 * (self.latency or 0.0), 0.1):
+            return
+        self._last_decrease = now
+        self._set_limit(self.limit / 2)
+
+    def _set_limit(self, limit: float) -> None:
+        self.limit = min(max(limit, float(self.minimum)), float(self.maximum))
+        M_RPC_CONCURRENCY_LIMIT.set(self.limit)
+        self._wake()
+
+class RpcQuota:
+    """
+    Client-side copy of a provider quota ("100 req/s, 40 concurrent"), shared by every
+    RPC caller so requests the provider would reject are never sent. Each HTTP request
+    takes its batch's call count and credit cost up front and holds an in-flight slot
+    until the response arrives.
+    """
+
+    def __init__(
+        self,
+        rps: float = RPC_MAX_RPS,
+        credits_per_second: float = RPC_MAX_CREDITS_PER_SECOND,
+        max_inflight: int = RPC_MAX_INFLIGHT,
+        method_credits: str = RPC_METHOD_CREDITS,
+    ):
+        self.calls = TokenBucket(rps) if rps > 0 else None
+        self.credits = TokenBucket(credits_per_second) if credits_per_second > 0 else None
+        self.slots = asyncio.Semaphore(max_inflight) if max_inflight > 0 else None
+        self.method_credits: Dict[str, float] = {}
+        for item in method_credits.split(","):
+            method, _, cost = item.partition("=")
+            if method.strip():
+                self.method_credits[method.strip()] = float(cost)
+
+    def cost(self, methods: List[str]) -> float:
+        return sum(self.method_credits.get(m, 1.0) for m in methods)
+
+    async def wait(self, calls: int, credits: float) -> None:
+        needs = [(b, c) for b, c in ((self.calls, calls), (self.credits, credits)) if b is not None]
+        t0 = time.perf_counter()
+        while True:
+            # A batch bigger than a whole second's allowance would never fit; let it
+            # through when the bucket is full and pay the debt afterwards.
+            wait = max((b.delay(min(c, b.capacity)) for b, c in needs), default=0.0)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        for bucket, cost in needs:
+            bucket.take(cost)
+        if needs:
+            M_RPC_QUOTA_WAIT.observe(time.perf_counter() - t0)
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """
+    Retry-After is either delta-seconds or an HTTP date.
+    """
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return default
+    return min(max(seconds, 0.0), RPC_RETRY_AFTER_MAX_SECONDS)
+
+# =========================
+# Solana RPC transport (JSON-RPC 2.0 batch arrays)
+# =========================
+class RpcError(RuntimeError):
+    def __init__(self, error: Any):
+        self.code = error.get("code") if isinstance(error, dict) else None
+        super().__init__(f"RPC error: {error}")
+
+class RpcUnavailable(RpcError):
+    """
+    Every endpoint's circuit breaker is open; nothing was sent.
+    """
+
+    def __init__(self):
+        super().__init__({"message": "all RPC endpoints unavailable"})
+
+class RpcHttpError(RpcError):
+    def __init__(self, status: int, body: str = "", retry_after: Optional[float] = None):
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__({"code": status, "message": f"HTTP {status} {body[:200]}".strip()})
+
+def url_host(url: str) -> str:
+    """
+    host[:port] only: paths and query strings often carry API keys, so this is what logs
+    and metric labels get.
+    """
+    return re.sub(r"^[a-z]+://", "", url).split("/")[0].split("?")[0]
+
+class RpcEndpoint:
+    """
+    One RPC provider: its routing weight, optional request rate limit and a running
+    health estimate (EWMA of successful round-trip latency and of the failure rate).
+    """
+
+    ALPHA = 0.2
+
+    def __init__(self, url: str, weight: float = 1.0, rps: float = 0.0):
+        self.url = url
+        self.name = url_host(url)
+        self.weight = max(0.01, weight)
+        self.bucket = TokenBucket(rps) if rps > 0 else None
+        self.paused_until = 0.0    # monotonic; set from Retry-After
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0     # consecutive
+        self.ejected = False  # circuit breaker open
+        self.open_for = RPC_PROBE_SECONDS
+        self.probe_at = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def cost(self) -> float:
+        """
+        Expected price of sending here now; lower is better. Unmeasured endpoints look
+        fast so they get tried, and a drained rate limit adds its wait.
+        """
+        latency = self.latency if self.latency is not None else 0.0
+        wait = max(0.0, self.paused_until - time.monotonic())
+        if self.bucket is not None:
+            wait = max(wait, self.bucket.delay())
+        # The 50 ms floor keeps weights meaningful between endpoints that are both fast.
+        return (max(latency, 0.05) + wait) * (1.0 + 10.0 * self.error_rate)
+
+    def record(self, seconds: float, ok: bool, throttled: bool = False) -> None:
+        self.requests += 1
+        if ok:
+            self.failures = 0
+            self.latency = seconds if self.latency is None else self.latency + self.ALPHA * (seconds - self.latency)
+        else:
+            self.errors += 1
+            # Throttling is the endpoint working as configured; it pauses, it isn't ejected.
+            if not throttled:
+                self.failures += 1
+        self.error_rate += self.ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if self.latency is not None:
+            M_RPC_ENDPOINT_LATENCY.set(self.latency, endpoint=self.name)
+        M_RPC_ENDPOINT_ERROR_RATE.set(self.error_rate, endpoint=self.name)
+
+def parse_rpc_endpoints(spec: str) -> List[RpcEndpoint]:
+    """
+    "url;weight=2;rps=50, url2" -> endpoints. Duplicate hosts get a #n suffix in their name.
+    """
+    endpoints: List[RpcEndpoint] = []
+    for part in spec.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if not fields[0]:
+            continue
+        options: Dict[str, float] = {}
+        for field in fields[1:]:
+            key, _, value = field.partition("=")
+            if key not in ("weight", "rps"):
+                raise ValueError(f"Unknown RPC endpoint option {key!r} in {part.strip()!r}")
+            options[key] = float(value)
+        endpoints.append(RpcEndpoint(fields[0], **options))
+    if not endpoints:
+        raise ValueError("No RPC endpoints configured")
+    names = collections.Counter()
+    for endpoint in endpoints:
+        names[endpoint.name] += 1
+        if names[endpoint.name] > 1:
+            endpoint.name = f"{endpoint.name}#{names[endpoint.name]}"
+    return endpoints
+
+class RpcEndpointPool:
+    """
+    Picks an endpoint per request: a weighted random choice among those in rotation,
+    each weighted by weight / cost(), so the faster and healthier an endpoint is the more
+    traffic it gets, without starving the others of the samples that let them recover.
+    Each endpoint has a circuit breaker: RPC_EJECT_FAILURES failures in a row open it
+    (the endpoint is ejected), a background getSlot probe after `open_for` seconds is
+    the half-open trial, and each failed probe doubles `open_for`. choose() returns None
+    when every candidate's breaker is open, so callers fail fast instead of sending.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, endpoints: List[RpcEndpoint]):
+        self.session = session
+        self.endpoints = endpoints
+        self._probe_task: Optional[asyncio.Task] = None
+        for endpoint in endpoints:
+            M_RPC_ENDPOINT_UP.set(1, endpoint=endpoint.name)
+
+    def choose(self, exclude: Any = ()) -> Optional[RpcEndpoint]:
+        candidates = [e for e in self.endpoints if e not in exclude and not e.ejected]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        return random.choices(candidates, weights=[e.weight / e.cost() for e in candidates])[0]
+
+    def record(self, endpoint: RpcEndpoint, seconds: float, error: Optional[BaseException]) -> None:
+        throttled = isinstance(error, RpcHttpError) and error.status == 429
+        endpoint.record(seconds, error is None, throttled)
+        if throttled:
+            pause = error.retry_after if error.retry_after is not None else 1.0
+            now = time.monotonic()
+            if endpoint.paused_until <= now:
+                logger.warning("RPC endpoint %s throttled; pausing it for %.1fs", endpoint.name, pause)
+            endpoint.paused_until = max(endpoint.paused_until, now + pause)
+            M_RPC_THROTTLED.inc(endpoint=endpoint.name)
+        if error is not None and not endpoint.ejected and endpoint.failures >= RPC_EJECT_FAILURES:
+            endpoint.ejected = True
+            endpoint.open_for = RPC_PROBE_SECONDS
+            endpoint.probe_at = time.monotonic() + endpoint.open_for
+            M_RPC_ENDPOINT_UP.set(0, endpoint=endpoint.name)
+            logger.warning(
+                "RPC endpoint %s circuit open after %d failures: %s",
+                endpoint.name, endpoint.failures, str(error) or rpc_status(error),
+            )
+            if self._probe_task is None or self._probe_task.done():
+                self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self) -> None:
+        while True:
+            ejected = [e for e in self.endpoints if e.ejected]
+            if not ejected:
+                return
+            wait = min(e.probe_at for e in ejected) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            for endpoint in [e for e in ejected if e.probe_at <= time.monotonic()]:
+                if await self._probe(endpoint):
+                    endpoint.ejected = False
+                    endpoint.failures = 0
+                    # Back in rotation, but it earns its full share by answering well.
+                    endpoint.error_rate = max(endpoint.error_rate, 0.5)
+                    M_RPC_ENDPOINT_UP.set(1, endpoint=endpoint.name)
+                    logger.info("RPC endpoint %s circuit closed", endpoint.name)
+                else:
+                    endpoint.open_for = min(endpoint.open_for * 2, RPC_BREAKER_MAX_OPEN_SECONDS)
+                    endpoint.probe_at = time.monotonic() + endpoint.open_for
+
+    async def _probe(self, endpoint: RpcEndpoint) -> bool:
+        """
+        Whether the endpoint answers at all. Any well-formed JSON-RPC reply counts, error
+        included: a node a few slots behind (-32005) still serves account reads, and the
+        breaker only tracks HTTP and transport failures.
+        """
+        try:
+            async with self.session.post(
+                endpoint.url,
+                json={"jsonrpc": "2.0", "id": 1, "method": "getSlot"},
+                timeout=aiohttp.ClientTimeout(total=RPC_TIMEOUT_SECONDS),
+            ) as resp:
+                if resp.status >= 400:
+                    return False
+                data = await resp.json(content_type=None)
+                return isinstance(data, dict) and ("result" in data or "error" in data)
+        except Exception:
+            return False
+
+    def available(self) -> bool:
+        return any(not e.ejected for e in self.endpoints)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "endpoint": e.name,
+                "weight": e.weight,
+                "ejected": e.ejected,
+                "requests": e.requests,
+                "errors": e.errors,
+                "latency_ewma": e.latency,
+                "error_rate_ewma": round(e.error_rate, 4),
+            }
+            for e in self.endpoints
+        ]
+
+    async def close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+
+class HedgePolicy:
+    """
+    When to hedge: after the p95 of recent successful round trips (once there are enough
+    samples), and only while hedges stay under `max_rate` of requests - every request
+    earns `max_rate` of a hedge, a hedge spends one.
+    """
+
+    PERCENTILE = 95
+    WINDOW = 512
+    MIN_SAMPLES = 32
+
+    def __init__(self, max_rate: float = RPC_HEDGE_MAX_RATE):
+        self.max_rate = max_rate
+        self._samples: Deque[float] = collections.deque(maxlen=self.WINDOW)
+        self._delay: Optional[float] = None
+        self._stale = 0
+        self._budget = 0.0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._stale += 1
+
+    def delay(self) -> Optional[float]:
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        # Re-sorting the window on every request would cost more than it saves.
+        if self._delay is None or self._stale >= self.MIN_SAMPLES:
+            ordered = sorted(self._samples)
+            self._delay = ordered[min(len(ordered) - 1, len(ordered) * self.PERCENTILE // 100)]
+            self._stale = 0
+        return self._delay
+
+    def earn(self) -> None:
+        self._budget = min(self._budget + self.max_rate, 10.0)
+
+    def spend(self) -> bool:
+        if self._budget < 1.0:
+            return False
+        self._budget -= 1.0
+        return True
+
+class RpcClient:
+    """
+    Gathers calls issued within RPC_BATCH_WINDOW_MS (or until RPC_BATCH_MAX_CALLS are queued)
+    and sends them as one JSON-RPC batch array; each caller's future is resolved by `id`.
+    Each batch goes to an endpoint picked by the pool and fails over to another endpoint
+    on transport or HTTP errors (JSON-RPC errors are answers, not endpoint failures).
+    Every request first waits for the shared RpcQuota; a 429 is retried after the
+    endpoint's Retry-After (or elsewhere) up to RPC_THROTTLE_RETRIES times. With
+    RPC_HEDGE_MAX_RATE set, slow requests are hedged (see HedgePolicy). An HTTP request
+    times out with the last of its callers' timeouts (RPC_TIMEOUT_SECONDS at most), so
+    an endpoint that hangs past them counts as failed.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        endpoints: Optional[List[RpcEndpoint]] = None,
+        window_ms: float = RPC_BATCH_WINDOW_MS,
+        max_calls: int = RPC_BATCH_MAX_CALLS,
+        quota: Optional[RpcQuota] = None,
+    ):
+        self.session = session
+        self.pool = RpcEndpointPool(session, endpoints or parse_rpc_endpoints(SOLANA_RPC_URLS))
+        self.quota = quota or RpcQuota()
+        self.hedge = HedgePolicy() if RPC_HEDGE_MAX_RATE > 0 else None
+        self.window = max(0.0, window_ms / 1000)
+        self.max_calls = max(1, max_calls)
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future, Optional[float]]] = []   # (request, future, deadline)
+        self._next_id = 1
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def call(self, method: str, params: Optional[list] = None, timeout: Optional[float] = None) -> Any:
+        """
+        `timeout` bounds the wait for this call's answer (asyncio.TimeoutError after it)
+        and, unless another call in the same batch waits longer, the HTTP request.
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req: Dict[str, Any] = {"jsonrpc": "2.0", "id": self._next_id, "method": method}
+        if params is not None:
+            req["params"] = params
+        self._next_id += 1
+        self._pending.append((req, fut, None if timeout is None else loop.time() + timeout))
+
+        if len(self._pending) >= self.max_calls:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        t0 = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            if timeout is None:
+                return await fut
+            return await asyncio.wait_for(fut, timeout)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            status = rpc_status(error)
+            M_RPC_LATENCY.observe(time.perf_counter() - t0, method=method, status=status)
+            M_RPC_CALLS.inc(method=method, status=status)
+            if error is not None:
+                M_RPC_ERRORS.inc(method=method, status=status)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._send(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        futures = {req["id"]: fut for req, fut, _deadline in batch}
+        # A lone call goes out as a plain object; not every provider accepts batch arrays.
+        payload: Any = batch[0][0] if len(batch) == 1 else [req for req, _fut, _deadline in batch]
+        credits = self.quota.cost([req["method"] for req, _fut, _deadline in batch])
+        deadlines = [deadline for _req, _fut, deadline in batch]
+        deadline = None if None in deadlines else max(deadlines)
+        tried: Set[RpcEndpoint] = set()
+        throttled = 0
+        error: Exception = RpcUnavailable()
+        while True:
+            endpoint = self.pool.choose(exclude=tried)
+            if endpoint is None:
+                for fut in futures.values():
+                    if not fut.done():
+                        fut.set_exception(error)
+                return
+            try:
+                data = await self._post_hedged(endpoint, payload, len(batch), credits, deadline)
+                break
+            except Exception as e:
+                error = e
+                if isinstance(e, RpcHttpError) and e.status == 429 and throttled < RPC_THROTTLE_RETRIES:
+                    # The endpoint is paused now; the pool routes around it or we wait it out.
+                    throttled += 1
+                    continue
+                tried.add(endpoint)
+                if len(tried) >= 3:
+                    tried = set(self.pool.endpoints)
+
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            fut = futures.get(item.get("id")) if isinstance(item, dict) else None
+            if fut is None:
+                # e.g. a batch-level parse error reported with id=null
+                continue
+            if fut.done():
+                continue
+            if "error" in item:
+                fut.set_exception(RpcError(item["error"]))
+            else:
+                fut.set_result(item.get("result"))
+
+        for fut in futures.values():
+            if not fut.done():
+                err = items[0].get("error") if len(items) == 1 and isinstance(items[0], dict) else None
+                fut.set_exception(RpcError(err or {"message": "no response for request id"}))
+
+    async def _post_hedged(
+        self,
+        endpoint: RpcEndpoint,
+        payload: Any,
+        calls: int,
+        credits: float,
+        deadline: Optional[float],
+    ) -> Any:
+        if self.hedge is None:
+            return await self._post(endpoint, payload, calls, credits, deadline)
+        self.hedge.earn()
+        delay = self.hedge.delay()
+        primary = asyncio.ensure_future(self._post(endpoint, payload, calls, credits, deadline))
+        if delay is None:
+            return await primary
+        pending: Set[asyncio.Future] = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            if not self.hedge.spend():
+                M_RPC_HEDGES.inc(result="capped")
+                return await primary
+            # With a single endpoint the hedge still goes out: stalls tend to be one
+            # request or connection, not the whole node.
+            backup = asyncio.ensure_future(
+                self._post(self.pool.choose(exclude={endpoint}) or endpoint, payload, calls, credits, deadline)
+            )
+            pending.add(backup)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        M_RPC_HEDGES.inc(result="won" if task is backup else "lost")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser is cancelled; its connection is dropped rather than read to the end.
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _post(
+        self,
+        endpoint: RpcEndpoint,
+        payload: Any,
+        calls: int,
+        credits: float,
+        deadline: Optional[float],
+    ) -> Any:
+        while True:
+            wait = max(0.0, endpoint.paused_until - time.monotonic())
+            if endpoint.bucket is not None:
+                wait = max(wait, endpoint.bucket.delay(min(calls, endpoint.bucket.capacity)))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if endpoint.bucket is not None:
+            endpoint.bucket.take(calls)
+        await self.quota.wait(calls, credits)
+        if self.quota.slots is not None:
+            async with self.quota.slots:
+                return await self._post_once(endpoint, payload, deadline)
+        return await self._post_once(endpoint, payload, deadline)
+
+    async def _post_once(self, endpoint: RpcEndpoint, payload: Any, deadline: Optional[float]) -> Any:
+        timeout = float(RPC_TIMEOUT_SECONDS)
+        if deadline is not None:
+            timeout = min(timeout, deadline - asyncio.get_running_loop().time())
+            if timeout <= 0:
+                # Queued (quota, Retry-After) past every caller's deadline: nothing to send,
+                # and nothing the endpoint did.
+                raise asyncio.TimeoutError()
+        t0 = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            async with self.session.post(
+                endpoint.url,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as resp:
+                if resp.status >= 400:
+                    raise RpcHttpError(
+                        resp.status,
+                        await resp.text(),
+                        retry_after=parse_retry_after(resp.headers.get("Retry-After")) if resp.status == 429 else None,
+                    )
+                return await resp.json(content_type=None)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # A cancelled request says nothing about the endpoint.
+            if not isinstance(error, asyncio.CancelledError):
+                elapsed = time.perf_counter() - t0
+                M_RPC_HTTP_LATENCY.observe(elapsed, endpoint=endpoint.name, status=rpc_status(error))
+                self.pool.record(endpoint, elapsed, error)
+                if error is None and self.hedge is not None:
+                    self.hedge.record(elapsed)
+
+    async def close(self) -> None:
+        await self.pool.close()
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
 
 # =========================
 # Solana RPC helpers
 # =========================
-async def rpc_get_balance_lamports(session: aiohttp.ClientSession, address: str) -> int:
-    payload = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "getBalance",
-        "params": [address],
-    }
-    async with session.post(
-        SOLANA_RPC_URL,
-        json=payload,
-        timeout=aiohttp.ClientTimeout(total=12),
-    ) as resp:
-        data = await resp.json(content_type=None)
+async def rpc_get_balance_at(rpc: RpcClient, address: str) -> Tuple[int, int]:
+    """
+    Returns: (context slot, lamports)
+    """
+    result = await rpc.call("getBalance", [address])
+    return int(result["context"]["slot"]), int(result["value"])
+
+async def rpc_get_balances_at(
+    rpc: RpcClient,
+    addresses: List[str],
+    timeout: Optional[float] = None,
+) -> Tuple[int, List[int]]:
+    """
+    Fetches lamports for up to RPC_BATCH_SIZE addresses in one getMultipleAccounts call.
+    Returns (context slot, balances in the same order as `addresses`); missing accounts
+    count as 0.
+    """
+    result = await rpc.call(
+        "getMultipleAccounts",
+        [addresses, {"encoding": "base64", "dataSlice": {"offset": 0, "length": 0}}],
+        timeout=timeout,
+    )
+    values = result["value"]
+    if len(values) != len(addresses):
+        raise RuntimeError(f"RPC returned {len(values)} accounts for {len(addresses)} addresses")
+    return int(result["context"]["slot"]), [int(v["lamports"]) if v else 0 for v in values]
+
+async def rpc_get_slot(rpc: RpcClient, commitment: Optional[str] = None) -> int:
+    return int(await rpc.call("getSlot", [{"commitment": commitment}] if commitment else None))
+
+async def rpc_get_block_accounts(rpc: RpcClient, slot: int) -> Optional[Dict[str, Any]]:
+    """
+    A confirmed block with account keys and pre/post balances per transaction but no
+    instructions; None if the slot was skipped. Raises RpcError(-32004) while the block
+    is not available yet.
+    """
+    try:
+        return await rpc.call(
+            "getBlock",
+            [slot, {
+                "encoding": "json",
+                "transactionDetails": "accounts",
+                "rewards": False,
+                "maxSupportedTransactionVersion": 0,
+                "commitment": "confirmed",
+            }],
+        )
+    except RpcError as e:
+        if e.code in (RPC_SLOT_SKIPPED, RPC_LONG_TERM_STORAGE_SLOT_SKIPPED):
+            return None
+        raise
+
+async def rpc_get_signatures_for_address(rpc: RpcClient, address: str, limit: int = 10) -> List[Dict[str, Any]]:
+    return await rpc.call("getSignaturesForAddress", [address, {"limit": limit}])
+
+# =========================
+# Solana WebSocket subscriptions (push mode)
+# =========================
+class AccountSubscriptionConnection:
+    """
+    One WebSocket carrying accountSubscribe streams for a subset of addresses.
+    Reconnects with backoff and re-subscribes everything it owns.
+    """
+
+    def __init__(self, monitor: "AccountSubscriptionMonitor", index: int):
+        self.monitor = monitor
+        self.index = index
+        self.addresses: Set[str] = set()
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._next_id = 1
+        self._pending: Dict[int, Tuple[str, str]] = {}   # request id -> (method, address)
+        self._sub_to_addr: Dict[int, str] = {}
+        self._addr_to_sub: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def add(self, address: str) -> None:
+        self.addresses.add(address)
+        await self._subscribe(address)
+
+    async def remove(self, address: str) -> None:
+        self.addresses.discard(address)
+        sub_id = self._addr_to_sub.pop(address, None)
+        if sub_id is not None:
+            self._sub_to_addr.pop(sub_id, None)
+            await self._send("accountUnsubscribe", [sub_id], address)
+
+    async def _send(self, method: str, params: list, address: str) -> None:
+        ws = self._ws
+        if ws is None or ws.closed:
+            return
+        req_id = self._next_id
+        self._next_id += 1
+        self._pending[req_id] = (method, address)
+        try:
+            await ws.send_json({"jsonrpc": "2.0", "id": req_id, "method": method, "params": params})
+        except Exception as e:
+            self._pending.pop(req_id, None)
+            logger.warning("WS #%d send failed: %s", self.index, e)
+
+    async def _subscribe(self, address: str) -> None:
+        await self._send(
+            "accountSubscribe",
+            [address, {"encoding": "base64", "commitment": "confirmed"}],
+            address,
+        )
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with self.monitor.session.ws_connect(self.monitor.url, heartbeat=30) as ws:
+                    self._ws = ws
+                    self._pending.clear()
+                    self._sub_to_addr.clear()
+                    self._addr_to_sub.clear()
+                    for address in list(self.addresses):
+                        await self._subscribe(address)
+                    logger.info("WS #%d connected, %d subscriptions", self.index, len(self.addresses))
+                    await self.monitor.connected()
+                    backoff = 1.0
+
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            await self._on_message(msg.json())
+                        elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("WS #%d error: %s", self.index, e)
+            finally:
+                self._ws = None
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def _on_message(self, data: Dict[str, Any]) -> None:
+        if data.get("method") == "accountNotification":
+            params = data.get("params") or {}
+            address = self._sub_to_addr.get(params.get("subscription"))
+            if address is None:
+                return
+            result = params.get("result") or {}
+            value = result.get("value")
+            lamports = int(value["lamports"]) if value else 0
+            await self.monitor.on_balance(address, lamports, (result.get("context") or {}).get("slot"))
+            return
+
+        pending = self._pending.pop(data.get("id"), None)
+        if pending is None:
+            return
+        method, address = pending
         if "error" in data:
-            raise RuntimeError(f"RPC error: {data['error']}")
-        return int(data["result"]["value"])
+            logger.warning("WS #%d %s failed for %s: %s", self.index, method, address, data["error"])
+            return
+        if method == "accountSubscribe":
+            sub_id = int(data["result"])
+            if address not in self.addresses or address in self._addr_to_sub:
+                # removed (or re-added) while the subscribe was in flight
+                await self._send("accountUnsubscribe", [sub_id], address)
+                return
+            self._sub_to_addr[sub_id] = address
+            self._addr_to_sub[address] = sub_id
+
+class AccountSubscriptionMonitor:
+    """
+    Multiplexes accountSubscribe streams for every watched address over as many
+    connections as needed (WS_SUBSCRIPTIONS_PER_CONNECTION each) and forwards
+    lamports from accountNotification to `on_balance(address, lamports, slot)`.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        on_balance: Callable[[str, int, Optional[int]], Awaitable[None]],
+        on_reconnect: Optional[Callable[[], Awaitable[None]]] = None,
+        url: str = SOLANA_WS_URL,
+        per_connection: int = WS_SUBSCRIPTIONS_PER_CONNECTION,
+    ):
+        self.session = session
+        self.on_balance = on_balance
+        self.on_reconnect = on_reconnect
+        self.url = url
+        self.per_connection = max(1, per_connection)
+        self._conns: List[AccountSubscriptionConnection] = []
+        self._owner: Dict[str, AccountSubscriptionConnection] = {}
+        self._connects = 0
+        self._registry_version = -1
+        self._following = asyncio.Lock()
+
+    @property
+    def addresses(self) -> Set[str]:
+        return set(self._owner)
+
+    async def sync(self, addresses: Set[str]) -> None:
+        for address in [a for a in self._owner if a not in addresses]:
+            await self._owner.pop(address).remove(address)
+        for address in addresses:
+            if address not in self._owner:
+                await self._subscribe(address)
+
+    async def follow(self, registry: WalletRegistry) -> None:
+        """
+        Subscribes to what `registry` watches, applying only its changes since the last
+        call (see changes_since); calls run one at a time so they apply in order.
+        """
+        async with self._following:
+            version, changes = registry.changes_since(self._registry_version)
+            self._registry_version = version
+            if changes is None:
+                await self.sync(set(registry.addresses()))
+                return
+            for address, added in changes:
+                if added and address not in self._owner:
+                    await self._subscribe(address)
+                elif not added and address in self._owner:
+                    await self._owner.pop(address).remove(address)
+
+    async def _subscribe(self, address: str) -> None:
+        conn = self._connection_with_room()
+        self._owner[address] = conn
+        await conn.add(address)
+
+    def _connection_with_room(self) -> AccountSubscriptionConnection:
+        for conn in self._conns:
+            if len(conn.addresses) < self.per_connection:
+                return conn
+        conn = AccountSubscriptionConnection(self, len(self._conns))
+        self._conns.append(conn)
+        conn.start()
+        return conn
+
+    async def connected(self) -> None:
+        # Changes that happened while a connection was down are never pushed.
+        self._connects += 1
+        if self._connects > len(self._conns) and self.on_reconnect is not None:
+            await self.on_reconnect()
+
+    async def stop(self) -> None:
+        await asyncio.gather(*(c.stop() for c in self._conns), return_exceptions=True)
+
+# =========================
+# Solana block stream (blocks mode)
+# =========================
+class BlockWatcher:
+    """
+    Follows confirmed slots and reads each block with transactionDetails "accounts"
+    (account keys, including lookup-table ones, plus pre/post balances). Keys are
+    intersected with the watched addresses and each match's balance after its last
+    transaction in the block goes to `on_balances({address: lamports}, slot)`, so the RPC cost
+    follows the chain rather than the number of wallets.
+
+    Blocks are fetched BLOCK_FETCH_CONCURRENCY at a time and applied in slot order.
+    Skipped slots are passed over; a block that is not available yet is retried on the
+    next poll. More than BLOCK_MAX_LAG_SLOTS behind, the watcher jumps to the tip and
+    calls `on_gap()` so a reconcile scan covers the slots it never read.
+    """
+
+    def __init__(
+        self,
+        rpc: RpcClient,
+        on_balances: Callable[[Dict[str, int], int], Awaitable[None]],
+        on_gap: Optional[Callable[[], Any]] = None,
+        poll: float = BLOCK_POLL_SECONDS,
+        concurrency: int = BLOCK_FETCH_CONCURRENCY,
+    ):
+        self.rpc = rpc
+        self.on_balances = on_balances
+        self.on_gap = on_gap
+        self.poll = poll
+        self.concurrency = max(1, concurrency)
+        self.next_slot: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.advance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Block watcher stalled at slot %s: %s", self.next_slot, e)
+            await asyncio.sleep(self.poll)
+
+    async def advance(self) -> None:
+        """
+        Reads every block from next_slot up to the current confirmed tip.
+        """
+        tip = await rpc_get_slot(self.rpc, commitment="confirmed")
+        if self.next_slot is None:
+            self.next_slot = tip
+        elif tip - self.next_slot > BLOCK_MAX_LAG_SLOTS:
+            logger.warning("Block watcher %d slots behind; skipping to %d", tip - self.next_slot, tip)
+            M_BLOCKS.inc(tip - self.next_slot, result="dropped")
+            self.next_slot = tip
+            if self.on_gap is not None:
+                self.on_gap()
+
+        while self.next_slot <= tip:
+            M_BLOCK_LAG.set(tip - self.next_slot + 1)
+            slots = range(self.next_slot, min(tip + 1, self.next_slot + self.concurrency))
+            results = await asyncio.gather(*(self._fetch(slot) for slot in slots), return_exceptions=True)
+            for slot, result in zip(slots, results):
+                if isinstance(result, RpcError) and result.code == RPC_BLOCK_NOT_AVAILABLE:
+                    return
+                if isinstance(result, BaseException):
+                    raise result
+                if result is None:
+                    M_BLOCKS.inc(result="skipped")
+                else:
+                    await self._apply(slot, result)
+                    M_BLOCKS.inc(result="read")
+                self.next_slot = slot + 1
+        M_BLOCK_LAG.set(0)
+
+    async def _fetch(self, slot: int) -> Optional[Dict[str, Any]]:
+        return await rpc_get_block_accounts(self.rpc, slot)
+
+    async def _apply(self, slot: int, block: Dict[str, Any]) -> None:
+        transactions = block.get("transactions") or []
+        keys: Set[str] = set()
+        for tx in transactions:
+            for key in tx["transaction"]["accountKeys"]:
+                keys.add(key["pubkey"] if isinstance(key, dict) else key)
+        watched = REGISTRY.watched(keys)
+        if not watched:
+            return
+
+        balances: Dict[str, int] = {}
+        for tx in transactions:
+            meta = tx.get("meta")
+            if not meta:
+                continue
+            # Failed transactions still charge their fee payer, so they count too.
+            for i, key in enumerate(tx["transaction"]["accountKeys"]):
+                address = key["pubkey"] if isinstance(key, dict) else key
+                if address in watched:
+                    balances[address] = int(meta["postBalances"][i])
+        M_BLOCK_MATCHES.inc(len(balances))
+        await self.on_balances(balances, slot)
 
 def lamports_to_sol(lamports: int) -> float:
     return lamports / 1_000_000_000
@@ -307,30 +2290,55 @@ def alerts_screen_text(wallet_rows: List[Tuple[int, str, str, int, Optional[int]
     total = len(wallet_rows)
     enabled = sum(1 for _id, _n, _a, en, _l in wallet_rows if en == 1)
     disabled = total - enabled
+    if ALERT_MIN_LAMPORTS > 0:
+        min_sol = f"{lamports_to_sol(ALERT_MIN_LAMPORTS):.9f}".rstrip("0").rstrip(".")
+        threshold = f"by at least *{min_sol}* SOL"
+    else:
+        threshold = "by *any* SOL amount"
 
     return (
         "🔔 *Alerts*\n"
         "━━━━━━━━━━━━━━━━━━━━\n\n"
-        "This bot sends a message when a wallet balance changes by *any* SOL amount.\n\n"
+        f"This bot sends a message when a wallet balance changes {threshold}.\n\n"
         f"✅ Alerts ON: *{enabled}*\n"
         f"🚫 Alerts OFF: *{disabled}*\n"
         f"👛 Total wallets: *{total}*\n\n"
         "Manage toggles under 👛 *My Wallets*."
     )
 
-def settings_screen_text() -> str:
+MONITOR_MODE_LABELS = {"poll": "Polling", "ws": "WebSocket push", "blocks": "Block stream"}
+
+def settings_screen_text(per_wallet_alerts: bool) -> str:
+    grouping = "One message per wallet" if per_wallet_alerts else "One summary per scan"
+    if ALERT_MIN_LAMPORTS > 0:
+        min_sol = f"{lamports_to_sol(ALERT_MIN_LAMPORTS):.9f}".rstrip("0").rstrip(".")
+        threshold = f"📏 Minimum change: *{min_sol} SOL* (all wallets)\n"
+        coming_threshold = "• Minimum change per wallet\n"
+    else:
+        threshold = ""
+        coming_threshold = "• Minimum change threshold per wallet\n"
     return (
         "⚙️ *Settings*\n"
         "━━━━━━━━━━━━━━━━━━━━\n\n"
         "Currently available:\n"
-        f"⏱ Scan interval: *{CHECK_INTERVAL_SECONDS}s*\n\n"
+        f"⏱ Scan interval: *{CHECK_INTERVAL_SECONDS}s*\n"
+        f"📡 Monitor mode: *{MONITOR_MODE_LABELS.get(MONITOR_MODE, 'Polling')}*\n"
+        f"📨 Alert grouping: *{grouping}*\n"
+        f"{threshold}\n"
         "Coming soon (if you want):\n"
-        "• Minimum change threshold per wallet\n"
+        f"{coming_threshold}"
         "• Silent hours (do not disturb)\n"
         "• Rename wallet\n"
         "• Alert history\n"
     )
 
+def settings_screen_keyboard(per_wallet_alerts: bool) -> InlineKeyboardMarkup:
+    label = "📨 Switch to one summary per scan" if per_wallet_alerts else "📨 Switch to one message per wallet"
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=CB_ALERT_GROUPING)],
+        [InlineKeyboardButton("🏠 Back to Dashboard", callback_data=CB_BACK_MENU)],
+    ])
+
 def help_screen_text() -> str:
     return (
         "🆘 *Help*\n"
@@ -343,7 +2351,7 @@ def help_screen_text() -> str:
         "🧠 *Commands*\n"
         "/start — open dashboard\n"
         "/cancel — cancel add-wallet flow\n\n"
-        "If you want this to scale to lots of users, ask me to switch it to Helius WebSockets."
+        "⚙️ Settings shows how balances are watched: polling, WebSocket push or the block stream."
     )
 
 def simple_back_keyboard() -> InlineKeyboardMarkup:
@@ -354,7 +2362,7 @@ def simple_back_keyboard() -> InlineKeyboardMarkup:
 # =========================
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, edit: bool = False) -> None:
     user_id = update.effective_user.id
-    rows = db_get_wallets(user_id)
+    rows = await db_call(db_get_wallets, user_id)
 
     last_check = context.application.bot_data.get("last_check_iso")
     text = dashboard_text(rows, last_check)
@@ -371,9 +2379,11 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, edi
 # =========================
 # Handlers
 # =========================
+@timed_handler
 async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await show_main_menu(update, context)
 
+@timed_handler
 async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     q = update.callback_query
     await q.answer()
@@ -398,7 +2408,7 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     # Screens
     if data == CB_WALLETS:
-        rows = db_get_wallets(user_id)
+        rows = await db_call(db_get_wallets, user_id)
         await q.edit_message_text(
             text=wallets_screen_text(rows, page=0),
             reply_markup=wallets_screen_keyboard(rows, page=0),
@@ -408,7 +2418,7 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     if data.startswith(CB_WALLETS_PAGE_PREFIX):
         page = int(data.split(":", 1)[1])
-        rows = db_get_wallets(user_id)
+        rows = await db_call(db_get_wallets, user_id)
         await q.edit_message_text(
             text=wallets_screen_text(rows, page=page),
             reply_markup=wallets_screen_keyboard(rows, page=page),
@@ -417,7 +2427,7 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
 
     if data == CB_ALERTS:
-        rows = db_get_wallets(user_id)
+        rows = await db_call(db_get_wallets, user_id)
         await q.edit_message_text(
             text=alerts_screen_text(rows),
             reply_markup=simple_back_keyboard(),
@@ -426,9 +2436,20 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
 
     if data == CB_SETTINGS:
+        per_wallet = REGISTRY.per_wallet_alerts(user_id)
         await q.edit_message_text(
-            text=settings_screen_text(),
-            reply_markup=simple_back_keyboard(),
+            text=settings_screen_text(per_wallet),
+            reply_markup=settings_screen_keyboard(per_wallet),
+            parse_mode="Markdown",
+        )
+        return ConversationHandler.END
+
+    if data == CB_ALERT_GROUPING:
+        per_wallet = not REGISTRY.per_wallet_alerts(user_id)
+        await db_call(db_set_per_wallet_alerts, user_id, per_wallet)
+        await q.edit_message_text(
+            text=settings_screen_text(per_wallet),
+            reply_markup=settings_screen_keyboard(per_wallet),
             parse_mode="Markdown",
         )
         return ConversationHandler.END
@@ -444,14 +2465,15 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Wallet actions
     if data.startswith(CB_TOGGLE_PREFIX):
         wallet_id = int(data.split(":", 1)[1])
-        new_enabled = db_toggle_wallet(user_id, wallet_id)
+        new_enabled = await db_call(db_toggle_wallet, user_id, wallet_id)
+        await sync_monitor(context.application)
         if new_enabled is None:
             await q.message.reply_text("⚠️ Couldn’t find that wallet.")
         else:
             await q.message.reply_text("✅ Notifications enabled 🔔" if new_enabled == 1 else "✅ Notifications disabled 🔕")
 
         # Return user to wallets screen page 0
-        rows = db_get_wallets(user_id)
+        rows = await db_call(db_get_wallets, user_id)
         await q.edit_message_text(
             text=wallets_screen_text(rows, page=0),
             reply_markup=wallets_screen_keyboard(rows, page=0),
@@ -461,10 +2483,11 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     if data.startswith(CB_DELETE_PREFIX):
         wallet_id = int(data.split(":", 1)[1])
-        ok = db_delete_wallet(user_id, wallet_id)
+        ok = await db_call(db_delete_wallet, user_id, wallet_id)
+        await sync_monitor(context.application)
         await q.message.reply_text("🗑 Removed ✅" if ok else "⚠️ Couldn’t remove (not found).")
 
-        rows = db_get_wallets(user_id)
+        rows = await db_call(db_get_wallets, user_id)
         await q.edit_message_text(
             text=wallets_screen_text(rows, page=0),
             reply_markup=wallets_screen_keyboard(rows, page=0),
@@ -474,6 +2497,7 @@ async def menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     return ConversationHandler.END
 
+@timed_handler
 async def add_wallet_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     name = (update.message.text or "").strip()
     if len(name) < 1 or len(name) > 40:
@@ -487,109 +2511,860 @@ async def add_wallet_name(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     return ASK_ADDRESS
 
+@timed_handler
 async def add_wallet_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     addr = (update.message.text or "").strip()
 
-    if not is_probably_solana_address(addr):
+    if not is_solana_address(addr):
         await update.message.reply_text("⚠️ That doesn’t look like a valid Solana address. Send the address again.")
         return ASK_ADDRESS
 
     name = context.user_data.get("new_wallet_name", "Wallet")
-    ok, msg = db_add_wallet(update.effective_user.id, name, addr)
+    ok, msg = await db_call(db_add_wallet, update.effective_user.id, name, addr)
     await update.message.reply_text(msg)
+    await sync_monitor(context.application)
 
-    # Set initial last balance so it doesn't "spam" on first scan
-    session: aiohttp.ClientSession = context.application.bot_data["http"]
-    try:
-        lamports = await rpc_get_balance_lamports(session, addr)
-        # Find matching wallet row and store last_lamports
-        for wid, _n, a, _en, _last in db_get_wallets(update.effective_user.id):
-            if a == addr:
-                db_update_last_lamports(wid, lamports)
-                break
-    except Exception as e:
-        logger.warning("Initial balance fetch failed: %s", e)
+    # Set initial last balance so it doesn't "spam" on first scan. Only when the address
+    # has none yet: the stored balance is shared by every subscriber, and moving it here
+    # would swallow a change the others have not been alerted about.
+    if ok and REGISTRY.balance(addr)[0] is None:
+        rpc: RpcClient = context.application.bot_data["rpc"]
+        try:
+            slot, lamports = await rpc_get_balance_at(rpc, addr)
+            await db_call(db_update_balances_many, [(addr, lamports, slot)])
+        except Exception as e:
+            logger.warning("Initial balance fetch failed: %s", e)
 
     context.user_data.pop("new_wallet_name", None)
     await show_main_menu(update, context)
     return ConversationHandler.END
 
+@timed_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data.pop("new_wallet_name", None)
     await update.message.reply_text("✅ Cancelled.")
     await show_main_menu(update, context)
     return ConversationHandler.END
 
+# =========================
+# Telegram outbound queue
+# =========================
+class OutboundMessage:
+    __slots__ = ("chat_id", "text", "parse_mode", "attempts")
+
+    def __init__(self, chat_id: int, text: str, parse_mode: Optional[str]):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.attempts = 0
+
+class AlertDispatcher:
+    """
+    Bounded outbound queue in front of bot.send_message. Each chat has its own FIFO and
+    token bucket (TG_CHAT_RATE msg/s) and every send also spends from a global bucket
+    (TG_GLOBAL_RATE msg/s). A scheduler heap releases chats as their budget allows, so a
+    busy chat never holds up the others. RetryAfter pauses the bucket that caused it;
+    network errors retry with exponential backoff up to ALERT_MAX_ATTEMPTS.
+    `enqueue` never waits on Telegram.
+    """
+
+    def __init__(
+        self,
+        bot: Any,
+        max_queued: int = ALERT_QUEUE_MAX,
+        global_rate: float = TG_GLOBAL_RATE,
+        chat_rate: float = TG_CHAT_RATE,
+        concurrency: int = 16,
+    ):
+        self.bot = bot
+        self.max_queued = max_queued
+        self.chat_rate = chat_rate
+        self._global = TokenBucket(global_rate)
+        self._queues: Dict[int, Deque[OutboundMessage]] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._heap: List[Tuple[float, int, int]] = []   # (due, seq, chat_id)
+        self._scheduled: Set[int] = set()               # chats in the heap or being sent
+        self._seq = itertools.count()
+        self._queued = 0
+        self._wakeup = asyncio.Event()
+        self._sem = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        await asyncio.gather(*([self._task] if self._task else []), *self._sending, return_exceptions=True)
+        if self._queued:
+            logger.warning("Alert queue stopped with %d undelivered messages", self._queued)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def enqueue(self, chat_id: int, text: str, parse_mode: Optional[str] = "Markdown") -> bool:
+        if self._queued >= self.max_queued:
+            self.dropped += 1
+            M_ALERTS.inc(result="dropped")
+            logger.warning("Alert queue full (%d), dropping message for %s", self._queued, chat_id)
+            return False
+        self._queues.setdefault(chat_id, collections.deque()).append(OutboundMessage(chat_id, text, parse_mode))
+        self._queued += 1
+        M_ALERT_QUEUE.set(self._queued)
+        if chat_id not in self._scheduled:
+            self._schedule(chat_id, 0.0)
+        return True
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    def _schedule(self, chat_id: int, not_before: float) -> None:
+        self._scheduled.add(chat_id)
+        due = max(not_before, time.monotonic() + self._bucket(chat_id).delay())
+        heapq.heappush(self._heap, (due, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            due, _seq, chat_id = self._heap[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                # Sleep until due, but wake early if something more urgent arrives.
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            bucket = self._bucket(chat_id)
+            wait = bucket.delay()
+            if wait > 0:
+                heapq.heapreplace(self._heap, (time.monotonic() + wait, next(self._seq), chat_id))
+                continue
+            wait = self._global.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            heapq.heappop(self._heap)
+            # A 429 for a chat we had not used recently can only be the global limit.
+            chat_was_idle = time.monotonic() - bucket.last_take > 3 / self.chat_rate
+            bucket.take()
+            self._global.take()
+            await self._sem.acquire()
+            task = asyncio.create_task(self._send(chat_id, chat_was_idle))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, chat_id: int, chat_was_idle: bool) -> None:
+        queue_ = self._queues[chat_id]
+        msg = queue_[0]
+        not_before = 0.0
+        t0 = time.perf_counter()
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=msg.text, parse_mode=msg.parse_mode)
+            M_TELEGRAM_LATENCY.observe(time.perf_counter() - t0, status="ok")
+            self._done(queue_)
+            self.sent += 1
+            M_ALERTS.inc(result="sent")
+        except RetryAfter as e:
+            M_TELEGRAM_LATENCY.observe(time.perf_counter() - t0, status="retry_after")
+            (self._global if chat_was_idle else self._bucket(chat_id)).pause(float(e.retry_after))
+            logger.warning("Telegram flood control for %s: retry in %ss", chat_id, e.retry_after)
+        except (Forbidden, BadRequest, ChatMigrated) as e:
+            M_TELEGRAM_LATENCY.observe(time.perf_counter() - t0, status=type(e).__name__)
+            self._done(queue_)
+            self.failed += 1
+            M_ALERTS.inc(result="failed")
+            logger.warning("Failed to notify user %s: %s", chat_id, e)
+        except Exception as e:
+            M_TELEGRAM_LATENCY.observe(time.perf_counter() - t0, status=type(e).__name__)
+            msg.attempts += 1
+            if msg.attempts >= ALERT_MAX_ATTEMPTS:
+                self._done(queue_)
+                self.failed += 1
+                M_ALERTS.inc(result="failed")
+                logger.warning("Giving up notifying user %s after %d attempts: %s", chat_id, msg.attempts, e)
+            else:
+                not_before = time.monotonic() + min(60.0, 2.0 ** msg.attempts)
+        finally:
+            self._sem.release()
+            if queue_:
+                self._schedule(chat_id, not_before)
+            else:
+                self._queues.pop(chat_id, None)
+                self._scheduled.discard(chat_id)
+
+    def _done(self, queue_: Deque[OutboundMessage]) -> None:
+        queue_.popleft()
+        self._queued -= 1
+        M_ALERT_QUEUE.set(self._queued)
+
 # =========================
 # Background balance monitor
 # =========================
-async def check_balances_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    app: Application = context.application
-    session: aiohttp.ClientSession = app.bot_data["http"]
+def alert_name(name: str) -> str:
+    """
+    A wallet name as typed by its user, for a Markdown alert. Legacy Markdown honours
+    escapes only outside entities, so names are never inside *bold*.
+    """
+    return escape_markdown(name, version=1)
 
-    # store dashboard timestamp
-    app.bot_data["last_check_iso"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def balance_alert_text(name: str, address: str, last_lamports: int, current: int) -> str:
+    delta = current - last_lamports
+    delta_sol = lamports_to_sol(abs(delta))
+    current_sol = lamports_to_sol(current)
 
-    rows = db_get_enabled_wallets_all_users()
-    if not rows:
-        return
+    direction = "increased 📈" if delta > 0 else "decreased 📉"
+    sign = "+" if delta > 0 else "-"
+
+    return (
+        f"💰 *Balance Update*\n"
+        "━━━━━━━━━━━━━━━━━━━━\n"
+        f"👛 {alert_name(name)}\n"
+        f"`{truncate_addr(address)}`\n\n"
+        f"{direction}\n"
+        f"Change: *{sign}{delta_sol:.9f}* SOL\n"
+        f"New balance: *{current_sol:.9f}* SOL"
+    )
 
-    sem = asyncio.Semaphore(8)
+def telegram_length(text: str) -> int:
+    # Telegram counts UTF-16 code units; emoji outside the BMP count twice.
+    return len(text.encode("utf-16-le")) // 2
 
-    async def process_one(wallet_id: int, user_id: int, name: str, address: str, last_lamports: Optional[int]):
-        async with sem:
+def combined_alert_texts(changes: List[Tuple[str, str, int, int]]) -> List[str]:
+    """
+    One summary for all of a user's changes in a pass: (name, address, last, current) each.
+    Split into several messages when it would exceed Telegram's 4096-character limit.
+    """
+    if len(changes) == 1:
+        return [balance_alert_text(*changes[0])]
+
+    blocks = []
+    for name, address, last_lamports, current in changes:
+        delta = current - last_lamports
+        sign = "+" if delta > 0 else "-"
+        blocks.append(
+            f"{'📈' if delta > 0 else '📉'} {alert_name(name)}  `{truncate_addr(address)}`\n"
+            f"Change: *{sign}{lamports_to_sol(abs(delta)):.9f}* SOL\n"
+            f"New balance: *{lamports_to_sol(current):.9f}* SOL"
+        )
+
+    header_reserve = 80
+    parts: List[List[str]] = [[]]
+    size = header_reserve
+    for block in blocks:
+        n = telegram_length(block) + 2
+        if parts[-1] and size + n > TELEGRAM_MAX_MESSAGE_LENGTH:
+            parts.append([])
+            size = header_reserve
+        parts[-1].append(block)
+        size += n
+
+    texts = []
+    for i, part in enumerate(parts):
+        suffix = f" ({i + 1}/{len(parts)})" if len(parts) > 1 else ""
+        texts.append(
+            f"💰 *Balance Updates* — {len(changes)} wallets{suffix}\n"
+            "━━━━━━━━━━━━━━━━━━━━\n\n"
+            + "\n\n".join(part)
+        )
+    return texts
+
+class BalanceChanges:
+    """
+    Updates and alerts collected during one pass. All updates are written in a single
+    transaction before any alert goes out: if the write fails, no alert is sent and
+    last_lamports is untouched, so the same changes are detected again next pass.
+    Alerts are grouped per user into one summary unless they opted for one per wallet.
+    """
+
+    def __init__(self):
+        self.updates: Dict[str, Tuple[int, Optional[int]]] = {}   # address -> (lamports, slot)
+        self.changes: List[Tuple[int, int, str, int, int]] = []   # (wallet_id, user_id, address, last, current)
+        self.changed: Dict[int, List[Tuple[str, str, int, int]]] = {}   # user_id -> (name, address, last, current)
+
+    def observe(
+        self,
+        addresses: List[str],
+        balances: List[int],
+        slots: Optional[List[int]] = None,
+    ) -> Tuple[int, List[str]]:
+        """
+        Compares fetched balances (read at `slots`) with the registry and keeps the new ones
+        and a change per subscribed wallet. Returns (wallets covered, changed addresses).
+        """
+        wallets, new, changes = REGISTRY.diff(addresses, balances, slots)
+        for address, current, slot in new:
+            self.updates[address] = (current, slot)
+        self.changes.extend(changes)
+        return wallets, list({c[2]: None for c in changes})
+
+    def alerts(self) -> List[Tuple[int, str]]:
+        out = []
+        for user_id, changes in self.changed.items():
+            if REGISTRY.per_wallet_alerts(user_id):
+                out.extend((user_id, balance_alert_text(*c)) for c in changes)
+            else:
+                out.extend((user_id, text) for text in combined_alert_texts(changes))
+        return out
+
+    async def commit(self, app: Application) -> bool:
+        if not self.updates:
+            return True
+        try:
+            # Names only for the wallets that changed; the registry doesn't keep them.
+            names = await db_call(db_get_wallet_names, [c[0] for c in self.changes]) if self.changes else {}
+            await db_call(db_update_balances_many, [(a, lamports, slot) for a, (lamports, slot) in self.updates.items()])
+        except Exception as e:
+            logger.error(
+                "Failed to persist %d balance updates; withholding alerts for %d wallets: %s",
+                len(self.updates), len(self.changes), e,
+            )
+            return False
+
+        for wallet_id, user_id, address, last, current in self.changes:
+            self.changed.setdefault(user_id, []).append((names.get(wallet_id, "Wallet"), address, last, current))
+        dispatcher: AlertDispatcher = app.bot_data["alerts"]
+        for user_id, text in self.alerts():
+            dispatcher.enqueue(user_id, text)
+        return True
+
+class ScanScheduler:
+    """
+    Timing wheel over the scan interval. Every address hashes into one of `slots` slots
+    and the wheel visits one slot per tick, so each address keeps an `interval` cadence
+    while requests go out as a steady stream of small batches instead of one burst per
+    interval. The slot count follows the number of tracked addresses (roughly one
+    getMultipleAccounts batch per slot, ticks no shorter than WHEEL_MIN_TICK_SECONDS) and
+    the wheel is rebuilt whenever the registry's membership moves it.
+
+    Within a slot only due addresses are fetched (adaptive tiers, see poll_interval), most
+    overdue first. An address is never fetched by two batches at once, and whatever a
+    batch could not reach within its budget is carried into the next tick. A failed
+    fetch waits for the address's next slot visit; addresses the RPC keeps rejecting
+    back off exponentially, and while the provider refuses every batch (e.g. -32005)
+    the whole wheel pauses. Failures and carry-overs are summarised in one log line
+    per interval.
+    """
+
+    def __init__(self, app: Application, interval: float, budget: float = SCAN_BUDGET_SECONDS):
+        self.app = app
+        self.interval = interval
+        self.budget = budget if budget > 0 else interval * 0.8
+        self.rpc_limiter = AdaptiveLimiter()
+        self._wakeup = asyncio.Event()
+        self._full_pass = False
+        self._slots: List[Set[str]] = [set()]
+        self._position = 0
+        self._registry_version = -1
+        self._last_scanned: Dict[str, float] = {}   # address -> loop time of last successful fetch
+        self._last_change: Dict[str, float] = {}    # address -> loop time of last observed change
+        self._backlog: Set[str] = set()
+        self._inflight: Set[str] = set()
+        self._batches: Set[asyncio.Task] = set()
+        self._failed: Dict[str, int] = {}           # address -> consecutive rejected fetches
+        self._retry_at: Dict[str, float] = {}       # address -> loop time it may be fetched again
+        self._refusals = 0                          # consecutive batches refused provider-wide
+        self._pause = 0.0
+        self._paused_until = 0.0
+        self._failure_counts: Dict[str, int] = collections.Counter()   # status -> addresses, this interval
+        self._carried = 0
+        self._reported = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def tick(self) -> float:
+        return self.interval / len(self._slots)
+
+    @property
+    def backlog(self) -> int:
+        return len(self._backlog)
+
+    def start(self, first: float = 5.0) -> None:
+        self._task = asyncio.create_task(self._run(first))
+
+    async def stop(self) -> None:
+        tasks = ([self._task] if self._task else []) + list(self._batches)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def trigger(self) -> None:
+        """
+        Fetch every tracked address on the next tick (e.g. after a WebSocket reconnect).
+        """
+        self._full_pass = True
+        self._wakeup.set()
+
+    # ---- membership ----
+
+    def sync(self) -> None:
+        """
+        Picks up wallets added, toggled or removed since the last tick: only the addresses
+        that appeared or went away, unless the registry was reloaded or this fell further
+        behind than its change log.
+        """
+        if REGISTRY.version == self._registry_version:
+            return
+        version, changes = REGISTRY.changes_since(self._registry_version)
+        self._registry_version = version
+        now = asyncio.get_running_loop().time()
+        if changes is None:
+            current = set(REGISTRY.addresses())
+            for address in [a for a in self._last_scanned if a not in current]:
+                self._untrack(address)
+            for address in current:
+                if address not in self._last_scanned:
+                    self._track(address, now)
+        else:
+            for address, added in changes:
+                if added and address not in self._last_scanned:
+                    self._track(address, now)
+                elif not added and address in self._last_scanned:
+                    self._untrack(address)
+
+        tracked = len(self._last_scanned)
+        slots = max(1, min(int(self.interval / WHEEL_MIN_TICK_SECONDS), math.ceil(tracked / RPC_BATCH_SIZE)))
+        if slots != len(self._slots):
+            self._slots = [set() for _ in range(slots)]
+            for address in self._last_scanned:
+                self._slots[self._slot_index(address)].add(address)
+            self._position %= slots
+            logger.info("Scan wheel: %d addresses over %d slots (tick %.2fs)", tracked, slots, self.tick)
+
+    def _track(self, address: str, now: float) -> None:
+        # New addresses are due on their first slot visit and start in the fast tier.
+        self._last_scanned[address] = now - self.interval
+        self._last_change[address] = now
+        self._slots[self._slot_index(address)].add(address)
+
+    def _untrack(self, address: str) -> None:
+        self._slots[self._slot_index(address)].discard(address)
+        del self._last_scanned[address]
+        del self._last_change[address]
+        self._backlog.discard(address)
+        self._failed.pop(address, None)
+        self._retry_at.pop(address, None)
+
+    def _slot_index(self, address: str) -> int:
+        return zlib.crc32(address.encode()) % len(self._slots)
+
+    # ---- ticking ----
+
+    async def _run(self, first: float) -> None:
+        loop = asyncio.get_running_loop()
+        await self._sleep(first)
+        next_tick = loop.time()
+        while True:
             try:
-                current = await rpc_get_balance_lamports(session, address)
-            except Exception as e:
-                logger.warning("Balance fetch failed for %s: %s", address, e)
-                return
+                self.sync()
+                if loop.time() < self._paused_until:
+                    pass   # the provider is refusing everything; see fetch_failed
+                elif self._full_pass:
+                    self._full_pass = False
+                    self._dispatch(self.due(self._last_scanned, force=True))
+                else:
+                    slot = self._slots[self._position]
+                    self._position = (self._position + 1) % len(self._slots)
+                    self._dispatch(self.due(self._backlog | slot))
+                self._report()
+            except Exception:
+                logger.exception("Scan tick failed")
+
+            next_tick += self.tick
+            # If we fell behind, carry on from now rather than bursting to catch up;
+            # anything that slipped is overdue and goes first on its next visit.
+            next_tick = max(next_tick, loop.time())
+            await self._sleep(next_tick - loop.time())
+
+    async def _sleep(self, delay: float) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _dispatch(self, addresses: List[str]) -> None:
+        if not addresses:
+            return
+        task = asyncio.create_task(self._scan(addresses))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _scan(self, addresses: List[str]) -> None:
+        self._inflight.update(addresses)
+        self._backlog.difference_update(addresses)
+        try:
+            with M_SCAN_DURATION.time():
+                _scanned, unreached = await scan_pass(self.app, self, addresses)
+            self._backlog.update(a for a in unreached if a in self._last_scanned)
+            self._carried += len(unreached)
+        finally:
+            self._inflight.difference_update(addresses)
+            M_SCAN_BACKLOG.set(len(self._backlog))
+
+    async def run_pass(self) -> None:
+        """
+        One full revolution at once: every tracked address, due or not, in a single batch.
+        """
+        self.sync()
+        await self._scan(self.due(self._last_scanned, force=True))
+        self._report(force=True)
+
+    # ---- adaptive tiers ----
+
+    def poll_interval(self, idle: float) -> float:
+        """
+        Tier 0 (every pass) while the address changed within ADAPTIVE_HOT_SECONDS, then
+        tier n polls every interval * 2**n where n = 1 + log2(idle / ADAPTIVE_HOT_SECONDS).
+        """
+        if not ADAPTIVE_POLLING or idle < ADAPTIVE_HOT_SECONDS:
+            return self.interval
+        tier = int(math.log2(idle / ADAPTIVE_HOT_SECONDS)) + 1
+        return min(self.interval * 2 ** tier, max(self.interval, ADAPTIVE_MAX_INTERVAL_SECONDS))
+
+    def due(self, candidates: Any, force: bool = False) -> List[str]:
+        """
+        Candidates that are due, not in flight and not backing off, most overdue first.
+        `force` ignores the polling tiers but never a backoff.
+        """
+        now = asyncio.get_running_loop().time()
+        # A slot comes round once per interval with some jitter; don't let jitter skip it.
+        slack = self.interval / 2
+        due: List[Tuple[float, str]] = []
+        for address in candidates:
+            if address in self._inflight:
+                continue
+            if self._retry_at and self._retry_at.get(address, 0.0) > now:
+                continue
+            scanned_at = self._last_scanned.get(address)
+            if scanned_at is None:
+                continue
+            overdue = now - scanned_at - self.poll_interval(now - self._last_change[address])
+            if force or overdue >= -slack:
+                due.append((overdue, address))
+        due.sort(key=lambda d: d[0], reverse=True)
+        return [address for _overdue, address in due]
+
+    def mark_scanned(self, addresses: List[str]) -> None:
+        now = asyncio.get_running_loop().time()
+        for address in addresses:
+            if address in self._last_scanned:
+                self._last_scanned[address] = now
+
+    def fetch_succeeded(self, addresses: List[str]) -> None:
+        self._refusals = 0
+        self._pause = 0.0
+        if self._failed:
+            for address in addresses:
+                if self._failed.pop(address, None) is not None:
+                    self._retry_at.pop(address, None)
+
+    def fetch_failed(self, addresses: List[str], error: BaseException) -> None:
+        """
+        Counts the failure for the interval summary; the addresses keep their last scan
+        time, so they are overdue and go first on their slot's next visit. Only a lone
+        address that the RPC still rejects as an invalid parameter (what scan_pass's
+        bisection ends with) is a problem with the address itself, so only that backs
+        off. Transport and HTTP failures are the endpoint breakers' business. Any other
+        JSON-RPC error on a whole batch (-32005 "node is behind", -32603) comes from the
+        provider: RPC_EJECT_FAILURES batches in a row pause the wheel for an interval,
+        doubling while the first batch after each pause is refused too.
+        """
+        self._failure_counts[rpc_status(error)] += len(addresses)
+        M_SCAN_FAILURES.inc(len(addresses), status=rpc_status(error))
+        if not isinstance(error, RpcError) or isinstance(error, (RpcHttpError, RpcUnavailable)):
+            return
+        now = asyncio.get_running_loop().time()
+        if error.code == RPC_INVALID_PARAMS:
+            if len(addresses) == 1 and addresses[0] in self._last_scanned:
+                failures = self._failed.get(addresses[0], 0) + 1
+                self._failed[addresses[0]] = failures
+                self._retry_at[addresses[0]] = now + min(self.interval * 2 ** failures, ADDRESS_BACKOFF_MAX_SECONDS)
+            return
+        if now < self._paused_until:
+            return   # sent before the pause began
+        self._refusals += 1
+        if self._pause or self._refusals >= RPC_EJECT_FAILURES:
+            self._pause = min(max(self._pause * 2, self.interval), max(self.interval, RPC_BREAKER_MAX_OPEN_SECONDS))
+            self._paused_until = now + self._pause
+            logger.warning("Scan: the RPC refuses every batch (%s); pausing scans for %.0fs", error, self._pause)
+
+    def note_change(self, address: str) -> None:
+        """
+        Snap an address back to the fast tier.
+        """
+        if address in self._last_change:
+            self._last_change[address] = asyncio.get_running_loop().time()
+
+    def _report(self, force: bool = False) -> None:
+        # O(addresses), so at most once per interval.
+        now = asyncio.get_running_loop().time()
+        if not force and now - self._reported < self.interval:
+            return
+        window = now - self._reported if self._reported else self.interval
+        self._reported = now
+
+        if self._failure_counts:
+            logger.warning(
+                "Scan: %d address fetches failed in the last %.0fs (%s); %d addresses backing off",
+                sum(self._failure_counts.values()), window,
+                ", ".join(f"{status} x{count}" for status, count in self._failure_counts.most_common()),
+                len(self._failed),
+            )
+            self._failure_counts.clear()
+        if self._carried:
+            logger.warning(
+                "Scan: %d due addresses ran past their batch budget (%.1fs) and were carried over",
+                self._carried, self.budget,
+            )
+            self._carried = 0
+        M_ADDRESS_BACKOFF.set(len(self._failed))
+
+        lag = 0.0
+        tiers: Dict[int, int] = {}
+        for address, scanned_at in self._last_scanned.items():
+            every = self.poll_interval(now - self._last_change[address])
+            if address not in self._failed:
+                lag = max(lag, now - scanned_at - every)
+            tier = int(round(math.log2(every / self.interval))) if every > self.interval else 0
+            tiers[tier] = tiers.get(tier, 0) + 1
+        M_SCAN_LAG.set(lag)
+        M_POLL_TIERS.clear()
+        for tier, count in tiers.items():
+            M_POLL_TIERS.set(count, tier=tier)
 
-            if last_lamports is None:
-                db_update_last_lamports(wallet_id, current)
-                return
+async def check_balances_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    One full scan pass outside the wheel (bench.py); shares its in-flight bookkeeping.
+    """
+    app = context.application
+    scheduler: Optional[ScanScheduler] = app.bot_data.get("scheduler")
+    if scheduler is None:
+        scheduler = app.bot_data["scheduler"] = ScanScheduler(app, CHECK_INTERVAL_SECONDS)
+    await scheduler.run_pass()
 
-            if current != last_lamports:
-                delta = current - last_lamports
-                db_update_last_lamports(wallet_id, current)
+async def scan_pass(app: Application, scheduler: ScanScheduler, addresses: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Fetches `addresses` (in priority order) within scheduler.budget, fans results out to
+    every subscriber and commits. Returns (scanned, unreached); fetch failures are in neither.
+    """
+    rpc: RpcClient = app.bot_data["rpc"]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + scheduler.budget
 
-                delta_sol = lamports_to_sol(abs(delta))
-                current_sol = lamports_to_sol(current)
+    # store dashboard timestamp
+    app.bot_data["last_check_iso"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-                direction = "increased 📈" if delta > 0 else "decreased 📉"
-                sign = "+" if delta > 0 else "-"
+    M_SCAN_ADDRESSES.set(len(addresses))
+    M_SCAN_WALLETS.set(len(REGISTRY))
 
-                msg = (
-                    f"💰 *Balance Update*\n"
-                    "━━━━━━━━━━━━━━━━━━━━\n"
-                    f"👛 *{name}*\n"
-                    f"`{truncate_addr(address)}`\n\n"
-                    f"{direction}\n"
-                    f"Change: *{sign}{delta_sol:.9f}* SOL\n"
-                    f"New balance: *{current_sol:.9f}* SOL"
-                )
+    if not rpc.pool.available():
+        # Every circuit breaker is open: known to fail, so don't spend anything on it.
+        scheduler.fetch_failed(addresses, RpcUnavailable())
+        return [], []
 
-                try:
-                    await app.bot.send_message(chat_id=user_id, text=msg, parse_mode="Markdown")
-                except Exception as e:
-                    logger.warning("Failed to notify user %s: %s", user_id, e)
+    scanned: List[str] = []
+    balances_read: List[int] = []
+    slots_read: List[int] = []
+    reached: Set[str] = set()
 
-    await asyncio.gather(*(process_one(*r) for r in rows), return_exceptions=True)
+    async def process_chunk(chunk: List[str]):
+        t0 = time.perf_counter()
+        async with scheduler.rpc_limiter as limiter:
+            M_SEMAPHORE_WAIT.observe(time.perf_counter() - t0)
+            if loop.time() >= deadline:
+                return
+            reached.update(chunk)
+            try:
+                # A fetch still unanswered at the deadline fails as a timeout, so the
+                # limiter backs off instead of seeing a cancellation it ignores.
+                with limiter.sample():
+                    slot, balances = await rpc_get_balances_at(rpc, chunk, timeout=deadline - loop.time())
+            except RpcError as e:
+                if e.code != RPC_INVALID_PARAMS or len(chunk) == 1:
+                    scheduler.fetch_failed(chunk, e)
+                    return
+                balances = None
+            except Exception as e:
+                scheduler.fetch_failed(chunk, e)
+                return
+
+        if balances is None:
+            # The RPC rejected something in the chunk (e.g. an address that isn't a valid
+            # public key). Bisect to isolate it so the rest of the chunk still gets scanned.
+            half = len(chunk) // 2
+            await asyncio.gather(process_chunk(chunk[:half]), process_chunk(chunk[half:]))
+            return
+        scheduler.fetch_succeeded(chunk)
+        scanned.extend(chunk)
+        balances_read.extend(balances)
+        slots_read.extend([slot] * len(chunk))
+
+    # Chunks queue on the limiter in priority order; one that only gets its turn after
+    # the deadline is carried over, one sent and still unanswered at it has failed.
+    chunks = [addresses[i:i + RPC_BATCH_SIZE] for i in range(0, len(addresses), RPC_BATCH_SIZE)]
+    tasks = [asyncio.create_task(process_chunk(c)) for c in chunks]
+    await asyncio.gather(*tasks)
+
+    # Compared in one batch: alerts wait for the single commit below anyway, and a whole
+    # pass is large enough for the vectorized path. Many users can track the same
+    # address: fetched once, fanned out here.
+    changes = BalanceChanges()
+    wallets, changed = changes.observe(scanned, balances_read, slots_read)
+    for address in changed:
+        scheduler.note_change(address)
+    M_WALLETS_SCANNED.inc(wallets)
+    if await changes.commit(app):
+        scheduler.mark_scanned(scanned)
+
+    unreached = [a for a in addresses if a not in reached]
+    return scanned, unreached
+
+async def apply_pushed_balance(app: Application, address: str, current: int, slot: Optional[int] = None) -> None:
+    await apply_pushed_balances(app, {address: current}, slot)
+
+async def apply_pushed_balances(app: Application, balances: Dict[str, int], slot: Optional[int] = None) -> None:
+    """
+    Balances reported by a push source (WebSocket or block) at `slot`, through the same
+    change detection, alerting and commit as a scan.
+    """
+    scheduler: Optional[ScanScheduler] = app.bot_data.get("scheduler")
+    changes = BalanceChanges()
+    slots = None if slot is None else [slot] * len(balances)
+    _wallets, changed = changes.observe(list(balances), list(balances.values()), slots)
+    if scheduler is not None:
+        for address in changed:
+            scheduler.note_change(address)
+    await changes.commit(app)
+
+async def sync_monitor(app: Application) -> None:
+    """
+    Pushes the current set of enabled addresses to the WebSocket monitor (no-op in poll mode).
+    """
+    monitor: Optional[AccountSubscriptionMonitor] = app.bot_data.get("monitor")
+    if monitor is not None:
+        await monitor.follow(REGISTRY)
+
+# =========================
+# Event loop lag
+# =========================
+async def loop_lag_monitor(app: Application, interval: float = 0.25) -> None:
+    """
+    Measures how late the loop wakes a fixed-interval sleep. Anything blocking the loop
+    (sync I/O, heavy CPU) shows up here; the latest window is kept in bot_data["loop_lag"].
+    """
+    loop = asyncio.get_running_loop()
+    worst = total = 0.0
+    samples = 0
+    window_start = loop.time()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - t0 - interval)
+        worst = max(worst, lag)
+        total += lag
+        samples += 1
+
+        if loop.time() - window_start >= LOOP_LAG_REPORT_SECONDS:
+            stats = {"max_ms": worst * 1000, "avg_ms": total / samples * 1000}
+            app.bot_data["loop_lag"] = stats
+            M_LOOP_LAG.set(worst, stat="max")
+            M_LOOP_LAG.set(total / samples, stat="avg")
+            logger.info("Event loop lag: avg %.1f ms, max %.1f ms", stats["avg_ms"], stats["max_ms"])
+            worst = total = 0.0
+            samples = 0
+            window_start = loop.time()
 
 # =========================
 # Startup / Shutdown
 # =========================
 async def on_startup(app: Application) -> None:
-    db_init()
+    await db_call(db_init)
+    REGISTRY.load(await db_call(db_get_enabled_wallets_all_users))
+    REGISTRY.load_alert_preferences(await db_call(db_get_per_wallet_alert_users))
     app.bot_data["http"] = aiohttp.ClientSession()
+    app.bot_data["rpc"] = RpcClient(app.bot_data["http"])
+    app.bot_data["alerts"] = AlertDispatcher(app.bot)
+    app.bot_data["alerts"].start()
     app.bot_data["last_check_iso"] = None
+    app.bot_data["loop_lag_task"] = asyncio.create_task(loop_lag_monitor(app))
+    if METRICS_PORT:
+        app.bot_data["metrics_runner"] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        logger.info("Metrics on http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+    logger.info("Loaded %d enabled wallets", len(REGISTRY))
+
+    if MONITOR_MODE == "ws":
+        async def on_push(address: str, lamports: int, slot: Optional[int]) -> None:
+            await apply_pushed_balance(app, address, lamports, slot)
+
+        scheduler = ScanScheduler(app, WS_RECONCILE_SECONDS)
+
+        async def on_reconnect() -> None:
+            scheduler.trigger()
+
+        monitor = AccountSubscriptionMonitor(app.bot_data["http"], on_push, on_reconnect)
+        app.bot_data["monitor"] = monitor
+        await sync_monitor(app)
+        logger.info("Bot started. Push mode via %s, reconciling every %ss", url_host(SOLANA_WS_URL), WS_RECONCILE_SECONDS)
+    elif MONITOR_MODE == "blocks":
+        async def on_balances(balances: Dict[str, int], slot: int) -> None:
+            await apply_pushed_balances(app, balances, slot)
+
+        scheduler = ScanScheduler(app, WS_RECONCILE_SECONDS)
+        watcher = BlockWatcher(app.bot_data["rpc"], on_balances, on_gap=scheduler.trigger)
+        app.bot_data["block_watcher"] = watcher
+        watcher.start()
+        logger.info("Bot started. Reading confirmed blocks, reconciling every %ss", WS_RECONCILE_SECONDS)
+    else:
+        scheduler = ScanScheduler(app, CHECK_INTERVAL_SECONDS)
+        logger.info("Bot started. Checking every %ss", CHECK_INTERVAL_SECONDS)
 
-    app.job_queue.run_repeating(check_balances_job, interval=CHECK_INTERVAL_SECONDS, first=5)
-    logger.info("Bot started. Checking every %ss", CHECK_INTERVAL_SECONDS)
+    app.bot_data["scheduler"] = scheduler
+    scheduler.start(first=5)
 
 async def on_shutdown(app: Application) -> None:
+    scheduler: Optional[ScanScheduler] = app.bot_data.get("scheduler")
+    if scheduler:
+        await scheduler.stop()
+    lag_task: Optional[asyncio.Task] = app.bot_data.get("loop_lag_task")
+    if lag_task:
+        lag_task.cancel()
+    metrics_runner: Optional[web.AppRunner] = app.bot_data.get("metrics_runner")
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    monitor: Optional[AccountSubscriptionMonitor] = app.bot_data.get("monitor")
+    if monitor:
+        await monitor.stop()
+    watcher: Optional[BlockWatcher] = app.bot_data.get("block_watcher")
+    if watcher:
+        await watcher.stop()
+    dispatcher: Optional[AlertDispatcher] = app.bot_data.get("alerts")
+    if dispatcher:
+        await dispatcher.stop()
+    rpc: Optional[RpcClient] = app.bot_data.get("rpc")
+    if rpc:
+        await rpc.close()
     session: aiohttp.ClientSession = app.bot_data.get("http")
     if session:
         await session.close()
+    await db_call(db_close)
     logger.info("Bot stopped.")
 
 def main() -> None:
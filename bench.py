@@ -0,0 +1,278 @@
+"""
+End-to-end scan benchmark against the local mock RPC (mock_rpc.py).
+
+    python bench.py --wallets 20000 --users 2000 --passes 20 --latency lognormal:30,0.5
+
+Seeds N synthetic wallets into a temporary DB_PATH, starts mock_rpc.py in a
+subprocess (so peak RSS below is the bot's own), runs check_balances_job against
+it with a fake bot, and reports wallets/s, p50/p99 scan time, RPC calls per scan
+and peak RSS. Between passes --mutate random addresses change balance.
+
+    python bench.py --endpoints 3 --fail-after 2
+
+runs one mock per endpoint behind SOLANA_RPC_URLS, takes the first one down (HTTP 503)
+after the given pass, and reports how requests spread across endpoints.
+
+    python bench.py --memory --wallets 1000000 --distinct 0.2
+
+only seeds the DB and reports what the loaded in-memory registry retains per wallet
+(tracemalloc), without starting the mock.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import gc
+import tempfile
+import resource
+import importlib
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from mock_rpc import random_address  # noqa: E402
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None) -> None:
+        self.sent += 1
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+async def start_mock(args: argparse.Namespace) -> Any:
+    port = free_port()
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(HERE, "mock_rpc.py"),
+        "--port", str(port),
+        "--latency", args.latency,
+        "--stall-rate", str(args.stall_rate),
+        "--stall-ms", str(args.stall_ms),
+        "--error-rate", str(args.error_rate),
+        "--rate-429", str(args.rate_429),
+        "--max-rps", str(args.max_rps),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/"
+    async with aiohttp.ClientSession() as s:
+        for _ in range(100):
+            try:
+                async with s.get(url + "stats") as resp:
+                    if resp.status == 200:
+                        return proc, url
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("mock_rpc.py did not start")
+
+def seed(sniffer: Any, wallets: int, users: int, distinct: float) -> None:
+    rng = random.Random(1)
+    n_addresses = max(1, int(wallets * distinct))
+    addresses = [random_address(rng) for _ in range(n_addresses)]
+    rows = []
+    seen = set()
+    for i in range(wallets):
+        user_id = 1_000_000 + i % users
+        address = addresses[i % n_addresses]
+        while (user_id, address) in seen:
+            address = rng.choice(addresses)
+        seen.add((user_id, address))
+        rows.append((user_id, f"wallet {i}", address))
+
+    sniffer.db_init()
+    with sniffer.db_pool().writer() as conn:
+        conn.executemany("INSERT INTO addresses (address) VALUES (?)", [(sniffer.decode_address(a),) for a in addresses])
+        conn.executemany(
+            "INSERT INTO subscriptions (user_id, address_id, name, enabled) "
+            "SELECT ?, id, ?, 1 FROM addresses WHERE address = ?",
+            [(user_id, name, sniffer.decode_address(a)) for user_id, name, a in rows],
+        )
+
+def registry_memory(args: argparse.Namespace) -> Dict[str, Any]:
+    db_dir = tempfile.mkdtemp(prefix="sniffer-bench-")
+    os.environ["DB_PATH"] = os.path.join(db_dir, "bench.db")
+    sniffer = importlib.import_module("Sniffer")
+    try:
+        seed(sniffer, args.wallets, args.users, args.distinct)
+        gc.collect()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        sniffer.REGISTRY.load(sniffer.db_get_enabled_wallets_all_users())
+        load_s = time.perf_counter() - t0
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "wallets": len(sniffer.REGISTRY),
+            "distinct_addresses": len(sniffer.REGISTRY.addresses()),
+            "load_seconds": round(load_s, 3),
+            "registry_mb": round(retained / 1e6, 2),
+            "registry_bytes_per_wallet": round(retained / max(1, args.wallets), 1),
+            "load_peak_mb": round(peak / 1e6, 2),
+        }
+    finally:
+        sniffer.db_close()
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    procs = []
+    if args.rpc_url:
+        urls = [u.strip() for u in args.rpc_url.split(",")]
+    else:
+        urls = []
+        for _ in range(args.endpoints):
+            proc, url = await start_mock(args)
+            procs.append(proc)
+            urls.append(url)
+
+    db_dir = tempfile.mkdtemp(prefix="sniffer-bench-")
+    os.environ["DB_PATH"] = os.path.join(db_dir, "bench.db")
+    os.environ["SOLANA_RPC_URLS"] = ",".join(urls)
+    os.environ["RPC_HEDGE_MAX_RATE"] = str(args.hedge_rate)
+    os.environ.setdefault("TG_GLOBAL_RATE", "1000000")
+    os.environ.setdefault("TG_CHAT_RATE", "1000000")
+    sniffer = importlib.import_module("Sniffer")
+
+    try:
+        t_seed = time.perf_counter()
+        seed(sniffer, args.wallets, args.users, args.distinct)
+        sniffer.REGISTRY.load(sniffer.db_get_enabled_wallets_all_users())
+        seed_s = time.perf_counter() - t_seed
+
+        bot = FakeBot()
+        async with aiohttp.ClientSession() as http, aiohttp.ClientSession() as admin:
+            app = SimpleNamespace(bot=bot, bot_data={}, job_queue=None)
+            app.bot_data["http"] = http
+            app.bot_data["rpc"] = sniffer.RpcClient(http)
+            app.bot_data["alerts"] = sniffer.AlertDispatcher(bot)
+            app.bot_data["alerts"].start()
+            context = SimpleNamespace(application=app)
+
+            async def stats() -> Dict[str, Any]:
+                total = {"rpc_calls": 0, "http_requests": 0}
+                for url in urls:
+                    async with admin.get(url + "stats") as resp:
+                        one = await resp.json()
+                    for key in total:
+                        total[key] += one[key]
+                return total
+
+            rng = random.Random(7)
+            addresses = sniffer.REGISTRY.addresses()
+            lamports = 1_000_000_000
+
+            # First pass only records baselines.
+            await sniffer.check_balances_job(context)
+
+            durations: List[float] = []
+            rpc_calls: List[int] = []
+            http_requests: List[int] = []
+            for i in range(args.passes):
+                if args.fail_after and i == args.fail_after:
+                    async with admin.post(urls[0] + "admin/fail", json={"status": 503}):
+                        pass
+                if args.mutate:
+                    # Same new balances on every endpoint, so they stay consistent.
+                    lamports -= 5000
+                    picked = rng.sample(addresses, min(args.mutate, len(addresses)))
+                    for url in urls:
+                        async with admin.post(url + "admin/mutate", json={"balances": {a: lamports for a in picked}}):
+                            pass
+                before = await stats()
+                t0 = time.perf_counter()
+                await sniffer.check_balances_job(context)
+                durations.append(time.perf_counter() - t0)
+                after = await stats()
+                rpc_calls.append(after["rpc_calls"] - before["rpc_calls"])
+                http_requests.append(after["http_requests"] - before["http_requests"])
+
+            await asyncio.sleep(0.2)
+            await app.bot_data["alerts"].stop()
+            endpoints = app.bot_data["rpc"].pool.stats()
+            await app.bot_data["rpc"].close()
+
+        mean = sum(durations) / len(durations) if durations else 0.0
+        return {
+            "wallets": args.wallets,
+            "distinct_addresses": len(sniffer.REGISTRY.addresses()),
+            "passes": args.passes,
+            "seed_seconds": round(seed_s, 3),
+            "wallets_per_second": round(args.wallets / mean, 1) if mean else None,
+            "scan_p50_ms": round(percentile(durations, 50) * 1000, 2),
+            "scan_p99_ms": round(percentile(durations, 99) * 1000, 2),
+            "scan_max_ms": round(max(durations) * 1000, 2) if durations else 0.0,
+            "rpc_calls_per_scan": round(sum(rpc_calls) / len(rpc_calls), 1) if rpc_calls else 0,
+            "http_requests_per_scan": round(sum(http_requests) / len(http_requests), 1) if http_requests else 0,
+            "alerts_sent": bot.sent,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "hedges": {k[0]: int(v) for k, v in sniffer.M_RPC_HEDGES._values.items()},
+            "endpoints": {
+                e["endpoint"]: f'{e["requests"]} req, {e["errors"]} err{", ejected" if e["ejected"] else ""}'
+                for e in endpoints
+            },
+        }
+    finally:
+        sniffer.db_close()
+        for proc in procs:
+            proc.terminate()
+            await proc.wait()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark check_balances_job against mock_rpc.py")
+    p.add_argument("--wallets", type=int, default=10_000)
+    p.add_argument("--users", type=int, default=1_000)
+    p.add_argument("--distinct", type=float, default=1.0, help="fraction of wallets with a distinct address")
+    p.add_argument("--passes", type=int, default=10)
+    p.add_argument("--mutate", type=int, default=50, help="addresses changed between passes")
+    p.add_argument("--latency", default="fixed:20")
+    p.add_argument("--stall-rate", type=float, default=0.0)
+    p.add_argument("--stall-ms", type=float, default=5000.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--rate-429", type=float, default=0.0)
+    p.add_argument("--max-rps", type=float, default=0.0)
+    p.add_argument("--endpoints", type=int, default=1, help="mock RPC endpoints to spawn")
+    p.add_argument("--fail-after", type=int, default=0, help="take the first endpoint down before this pass")
+    p.add_argument("--hedge-rate", type=float, default=0.0, help="RPC_HEDGE_MAX_RATE for the bot (0 = no hedging)")
+    p.add_argument("--rpc-url", help="use already running RPC endpoint(s), comma-separated, instead of mock_rpc.py")
+    p.add_argument("--memory", action="store_true", help="only measure the loaded registry's memory")
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    return p.parse_args(argv)
+
+def main() -> None:
+    args = parse_args()
+    report = registry_memory(args) if args.memory else asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    width = max(len(k) for k in report)
+    for k, v in report.items():
+        print(f"{k.ljust(width)}  {v}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Self-checks for Sniffer.py logic that can break without any scan failing loudly.
+
+    python checks.py
+
+Each check_* function builds what it needs in a temporary directory, asserts, and
+raises AssertionError on the first mismatch. No network, no mock RPC.
+"""
+import os
+import sys
+import random
+import asyncio
+import sqlite3
+import tempfile
+import importlib
+from typing import Any, Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="sniffer-checks-"), "checks.db"))
+sniffer: Any = importlib.import_module("Sniffer")
+
+from mock_rpc import random_address  # noqa: E402
+
+# The wallets table as every release before the addresses/subscriptions split created it.
+BASELINE_SCHEMA = """
+    CREATE TABLE wallets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        address TEXT NOT NULL,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        last_lamports INTEGER,
+        UNIQUE(user_id, address)
+    );
+    CREATE INDEX idx_wallets_user_id ON wallets(user_id);
+    CREATE INDEX idx_wallets_enabled ON wallets(enabled);
+    CREATE TABLE user_settings (
+        user_id INTEGER PRIMARY KEY,
+        alert_per_wallet INTEGER NOT NULL DEFAULT 0
+    );
+"""
+
+def use_db(path: str) -> None:
+    sniffer.db_close()
+    sniffer.DB_PATH = path
+
+def check_migration() -> None:
+    """
+    A baseline-schema DB migrated all the way up: shared addresses keep one balance
+    (an enabled wallet's), disabled wallets survive, undecodable addresses are dropped
+    with their subscriptions, and wallet ids are neither renumbered nor reused.
+    """
+    shared, lone, unset = random_address(), random_address(), random_address()
+    invalid = "1" * 40   # passed the old regex, decodes to 40 bytes
+    path = os.path.join(tempfile.mkdtemp(prefix="sniffer-checks-"), "baseline.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO wallets (id, user_id, name, address, enabled, last_lamports) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (3, 1, "main", shared, 1, 100),
+            (7, 2, "copy", shared, 0, 50),       # disabled, stale balance
+            (9, 2, "solo", lone, 0, 40),          # disabled and alone on its address
+            (10, 3, "new", unset, 1, None),
+            (11, 4, "other", unset, 0, 70),       # only a disabled wallet has a balance
+            (12, 3, "typo", invalid, 1, None),
+        ],
+    )
+    conn.execute("INSERT INTO user_settings (user_id, alert_per_wallet) VALUES (2, 1)")
+    conn.commit()
+    conn.close()
+
+    use_db(path)
+    sniffer.db_init()
+    sniffer.db_init()   # a second start finds nothing to do
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == sniffer.SCHEMA_VERSION
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "wallets" not in tables and {"addresses", "subscriptions"} <= tables, tables
+
+        addresses = {
+            sniffer.b58encode(key): (lamports, slot)
+            for key, lamports, slot in conn.execute("SELECT address, last_lamports, last_slot FROM addresses")
+        }
+        assert addresses == {shared: (100, None), lone: (40, None), unset: (None, None)}, addresses
+        assert conn.execute("SELECT COUNT(*) FROM addresses WHERE typeof(address) != 'blob' OR length(address) != 32").fetchone()[0] == 0
+
+        subscriptions = sorted(conn.execute(
+            "SELECT s.id, s.user_id, s.name, s.enabled, a.address FROM subscriptions s JOIN addresses a ON a.id = s.address_id"
+        ))
+        expected = [
+            (3, 1, "main", 1, shared),
+            (7, 2, "copy", 0, shared),
+            (9, 2, "solo", 0, lone),
+            (10, 3, "new", 1, unset),
+            (11, 4, "other", 0, unset),
+        ]
+        assert [(i, u, n, e, sniffer.b58encode(a)) for i, u, n, e, a in subscriptions] == expected, subscriptions
+        assert conn.execute("SELECT user_id, alert_per_wallet FROM user_settings").fetchall() == [(2, 1)]
+    finally:
+        conn.close()
+
+    # The screens' view of the same data.
+    assert sniffer.db_get_wallets(2) == [(9, "solo", lone, 0, 40), (7, "copy", shared, 0, 100)]
+    assert sniffer.db_get_wallets(3) == [(10, "new", unset, 1, None)]
+    enabled = sorted(r[0] for r in sniffer.db_get_enabled_wallets_all_users())
+    assert enabled == [3, 10], enabled
+
+    # Inline buttons already sent carry wallet ids: the dropped 12 must not come back.
+    ok, _msg = sniffer.db_add_wallet(5, "fresh", random_address())
+    assert ok
+    assert max(r[0] for r in sniffer.db_get_wallets(5)) > 12
+    sniffer.db_close()
+
+def parse_markdown(text: str) -> str:
+    """
+    Telegram's legacy Markdown (parse_mode="Markdown") reduced to what the alerts use:
+    the plain text, or ValueError where the Bot API would answer "can't parse entities".
+    Backslash escapes count only outside an entity; inside one, text runs to the first
+    closing character.
+    """
+    out: List[str] = []
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == "\\" and text[i + 1:i + 2] in ("_", "*", "`", "["):
+            out.append(text[i + 1])
+            i += 2
+        elif c in "_*`":
+            end = text.find(c, i + 1)
+            if end < 0:
+                raise ValueError(f"can't find end of the entity starting at {i}: {text[i:i + 40]!r}")
+            out.append(text[i + 1:end])
+            i = end + 1
+        elif c == "[":
+            end = text.find("]", i + 1)
+            if end < 0:
+                raise ValueError(f"can't find end of the link starting at {i}: {text[i:i + 40]!r}")
+            out.append(text[i + 1:end])
+            i = end + 1
+            if text[i:i + 1] == "(":
+                i = text.index(")", i) + 1
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+def check_alert_texts() -> None:
+    """
+    Wallet names are typed by users and land in Markdown alerts: whatever they contain,
+    every alert parses and shows the name as typed. A long summary splits into parts that
+    each fit in one Telegram message, in order, every wallet exactly once.
+    """
+    names = ["my_wallet", "a*b", "[cold", "`x`", "back\\slash_", "*_[`" * 10]
+    for name in names:
+        text = sniffer.balance_alert_text(name, random_address(), 1_000, 2_000)
+        assert name in parse_markdown(text), (name, text)
+    changes = [(name, random_address(), 5_000, 4_000) for name in names]
+    [text] = sniffer.combined_alert_texts(changes)
+    plain = parse_markdown(text)
+    assert all(name in plain for name in names), plain
+
+    changes = [(f"{i:03d}" + "_*" * 18 + "[", random_address(), 10**9, 10**9 + i + 1) for i in range(200)]
+    texts = sniffer.combined_alert_texts(changes)
+    assert len(texts) > 1, len(texts)
+    seen: List[str] = []
+    for part, text in enumerate(texts, 1):
+        assert sniffer.telegram_length(text) <= sniffer.TELEGRAM_MAX_MESSAGE_LENGTH, (part, sniffer.telegram_length(text))
+        plain = parse_markdown(text)
+        assert f"({part}/{len(texts)})" in plain.splitlines()[0], plain.splitlines()[0]
+        seen.extend(name for name, *_rest in changes if name in plain)
+    assert seen == [name for name, *_rest in changes], "every wallet once, in order"
+
+def _diff_both(registry: Any, addresses: List[str], balances: List[int], slots: Any, min_delta: int) -> Tuple[Any, ...]:
+    """
+    WalletRegistry.diff through the loop and, when numpy is installed, through the
+    vectorized path on the same state; both must agree.
+    """
+    saved = sniffer.VECTORIZE_MIN_BATCH
+    try:
+        sniffer.VECTORIZE_MIN_BATCH = len(addresses) + 1
+        loop = registry.diff(addresses, balances, slots, min_delta)
+        if sniffer.np is not None:
+            sniffer.VECTORIZE_MIN_BATCH = 0
+            vectorized = registry.diff(addresses, balances, slots, min_delta)
+            assert vectorized == loop, (loop, vectorized)
+    finally:
+        sniffer.VECTORIZE_MIN_BATCH = saved
+    return loop
+
+def check_diff_paths() -> None:
+    """
+    WalletRegistry.diff: a read older than the held slot is ignored, an address's first
+    balance is new but not a change, a change below min_delta is neither, and a change
+    fans out to every wallet on the address. _diff_loop and _diff_vectorized agree on
+    all of it, checked against a random registry when numpy is installed.
+    """
+    shared, fresh, other = random_address(), random_address(), random_address()
+    registry = sniffer.WalletRegistry()
+    registry.load([
+        (1, 10, "a", shared, 1_000, 50),
+        (2, 20, "b", shared, 1_000, 50),
+        (3, 10, "c", fresh, None, None),
+        (4, 30, "d", other, 5_000, None),
+    ])
+    untracked = random_address()
+
+    wallets, new, changed = _diff_both(registry, [shared, untracked], [2_000, 7], [49, 60], 0)
+    assert (wallets, new, changed) == (2, [], []), "read older than the held slot"
+
+    wallets, new, changed = _diff_both(registry, [fresh], [300], [60], 0)
+    assert (wallets, new, changed) == (1, [(fresh, 300, 60)], []), "first read"
+
+    wallets, new, changed = _diff_both(registry, [shared, other], [1_099, 5_000], None, 100)
+    assert (wallets, new, changed) == (3, [], []), "below min_delta"
+
+    wallets, new, changed = _diff_both(registry, [shared], [1_100], [50], 100)
+    assert new == [(shared, 1_100, 50)], new
+    assert sorted(changed) == [(1, 10, shared, 1_000, 1_100), (2, 20, shared, 1_000, 1_100)], changed
+
+    if sniffer.np is None:
+        print("    numpy not installed: random comparison skipped")
+        return
+    rng = random.Random(25)
+    for _ in range(200):
+        registry = sniffer.WalletRegistry()
+        pool = [random_address() for _ in range(rng.randint(1, 60))]
+        registry.load([
+            (wallet_id, rng.randint(1, 2**40), "w", rng.choice(pool),
+             rng.choice([None, rng.randint(0, 10**12)]), rng.choice([None, rng.randint(0, 100)]))
+            for wallet_id in range(rng.randint(1, 120))
+        ])
+        batch = rng.sample(pool, rng.randint(0, len(pool))) + [random_address() for _ in range(rng.randint(0, 3))]
+        held: Dict[str, int] = {a: registry.balance(a)[0] or 0 for a in batch}
+        balances = [max(0, rng.choice([held[a], held[a] + rng.randint(-5_000, 5_000), rng.randint(0, 10**12)])) for a in batch]
+        slots = rng.choice([None, [rng.randint(0, 100) for _ in batch]])
+        _diff_both(registry, batch, balances, slots, rng.choice([0, 1_000, 10**11]))
+        # The vectorized path exports the arrays; they must be able to grow afterwards.
+        registry.add(10**6, 1, random_address(), None)
+
+def check_scheduler_sync() -> None:
+    """
+    ScanScheduler.sync follows the registry from its change log: after any mix of adds,
+    re-adds and removals (more than the log holds, and across a reload) the wheel holds
+    exactly the watched addresses, each once, in its own slot.
+    """
+    async def run() -> None:
+        registry = sniffer.REGISTRY
+        pool = [random_address() for _ in range(300)]
+        registry.load([(i, 1, "w", address, None) for i, address in enumerate(pool[:100])])
+        scheduler = sniffer.ScanScheduler(None, 10.0)
+        rng = random.Random(15)
+        wallets: Dict[int, str] = {i: address for i, address in enumerate(pool[:100])}
+        next_id = 100
+        for step in range(60):
+            if step == 30:
+                # More new addresses than the change log holds: sync has to resync.
+                for _ in range(sniffer.WalletRegistry.CHANGE_LOG_MAX + 50):
+                    wallets[next_id] = random_address()
+                    registry.add(next_id, 1, wallets[next_id], None)
+                    next_id += 1
+            for _ in range(rng.randint(0, 40)):
+                if wallets and rng.random() < 0.5:
+                    wallet_id = rng.choice(list(wallets))
+                    registry.remove(wallet_id)
+                    del wallets[wallet_id]
+                else:
+                    wallets[next_id] = rng.choice(pool)
+                    registry.add(next_id, 1, wallets[next_id], None)
+                    next_id += 1
+            if step == 45:
+                registry.load([(i, 1, "w", address, None) for i, address in wallets.items()])
+            scheduler.sync()
+            watched = set(wallets.values())
+            assert set(scheduler._last_scanned) == watched, step
+            placed = [a for slot in scheduler._slots for a in slot]
+            assert sorted(placed) == sorted(watched), step
+            assert all(a in scheduler._slots[scheduler._slot_index(a)] for a in watched), step
+        registry.load([])
+
+    asyncio.run(run())
+
+CHECKS: List[Callable[[], None]] = [check_migration, check_diff_paths, check_alert_texts, check_scheduler_sync]
+
+def main() -> None:
+    for check in CHECKS:
+        check()
+        print(f"ok  {check.__name__}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+"""
+Local stand-in for a Solana JSON-RPC node, for benchmarks and offline testing.
+
+    python mock_rpc.py --port 8899 --latency lognormal:25,0.5 --error-rate 0.01 --rate-429 0.01
+
+Serves getBalance, getMultipleAccounts, getSlot, getHealth, getBlock and
+getSignaturesForAddress over HTTP POST (single objects and batch arrays) and
+accountSubscribe/accountUnsubscribe over WebSocket on the same URL. Unknown addresses
+start at --default-lamports.
+
+The slot advances every --slot-ms. getBlock serves, for each slot, either a recorded
+block (--blocks FILE: a JSON list of {"slot": N, "block": <getBlock result> or null for
+a skipped slot}; the clock then starts at the first recorded slot) or a block
+synthesised from the balance changes made during that slot, one transaction per
+change, padded with --block-noise transactions between random accounts.
+
+Admin endpoints (not part of Solana's API):
+    GET  /stats          request/call counters
+    POST /admin/mutate   {"count": 10, "delta": -5000}, {"address": "...", "lamports": 1}
+                         or {"balances": {"<address>": 1, ...}}
+    POST /admin/fail     {"status": 503} answers every RPC POST with that status; 0 recovers
+    POST /admin/reset    zero the counters
+
+Run several on different ports to stand in for a multi-provider SOLANA_RPC_URLS.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger("mock_rpc")
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def b58encode(raw: bytes) -> str:
+    n = int.from_bytes(raw, "big")
+    out = []
+    while n:
+        n, r = divmod(n, 58)
+        out.append(B58_ALPHABET[r])
+    pad = len(raw) - len(raw.lstrip(b"\0"))
+    return "1" * pad + "".join(reversed(out))
+
+def is_pubkey(address: Any) -> bool:
+    """
+    Whether `address` is base58 for exactly 32 bytes, as a real node checks.
+    """
+    if not isinstance(address, str) or not address or any(c not in B58_ALPHABET for c in address):
+        return False
+    n = 0
+    for c in address:
+        n = n * 58 + B58_ALPHABET.index(c)
+    pad = len(address) - len(address.lstrip("1"))
+    return pad + (n.bit_length() + 7) // 8 == 32
+
+def random_address(rng: random.Random = random) -> str:
+    return b58encode(bytes(rng.getrandbits(8) for _ in range(32)))
+
+class Latency:
+    """
+    "0", "fixed:MS", "uniform:LO,HI" or "lognormal:MEDIAN_MS,SIGMA", plus optional stalls:
+    with probability `stall_rate` a request takes `stall_ms` instead.
+    """
+
+    def __init__(self, spec: str = "0", stall_rate: float = 0.0, stall_ms: float = 0.0):
+        kind, _, args = spec.partition(":")
+        self.kind = kind if args else ("fixed" if kind not in ("", "0") else "none")
+        nums = [float(x) for x in (args or kind).split(",") if x] if self.kind != "none" else []
+        self.args = nums
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+
+    def sample_ms(self) -> float:
+        if self.stall_rate and random.random() < self.stall_rate:
+            return self.stall_ms
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return random.uniform(self.args[0], self.args[1])
+        if self.kind == "lognormal":
+            return random.lognormvariate(math.log(max(self.args[0], 1e-3)), self.args[1])
+        return 0.0
+
+class MockSolanaRpc:
+    def __init__(
+        self,
+        latency: Optional[Latency] = None,
+        error_rate: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: int = 1,
+        max_rps: float = 0.0,
+        default_lamports: int = 1_000_000_000,
+        fail_status: int = 0,
+        capacity: int = 0,
+        slot_ms: float = 400.0,
+        block_noise: int = 0,
+    ):
+        self.latency = latency or Latency()
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.default_lamports = default_lamports
+        self.fail_status = fail_status
+        # Requests served at once; the rest queue, so latency grows with offered load.
+        self.capacity = capacity
+        self._capacity: Optional[asyncio.Semaphore] = None
+
+        self.balances: Dict[str, int] = {}
+        self.started = time.monotonic()
+        self.base_slot = 250_000_000
+        self.slot_seconds = slot_ms / 1000
+        self.block_noise = block_noise
+        self.recorded: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._slot_changes: Dict[int, List[Tuple[str, int, int]]] = {}   # slot -> [(address, pre, post)]
+        self.http_requests = 0
+        self.http_429 = 0
+        self.http_failed = 0
+        self.calls: Dict[str, int] = {}
+        self.errors = 0
+
+        self._rps_window = (0, 0)   # (second, count)
+        self._ws_subs: Dict[int, Tuple[web.WebSocketResponse, str]] = {}
+        self._addr_subs: Dict[str, Set[int]] = {}
+        self._next_sub = 1
+
+    # ---- state ----
+
+    @property
+    def slot(self) -> int:
+        return self.base_slot + int((time.monotonic() - self.started) / self.slot_seconds)
+
+    def load_blocks(self, entries: List[Dict[str, Any]]) -> None:
+        self.recorded = {int(e["slot"]): e.get("block") for e in entries}
+        if self.recorded:
+            self.base_slot = min(self.recorded)
+            self.started = time.monotonic()
+
+    def lamports(self, address: str) -> int:
+        return self.balances.setdefault(address, self.default_lamports)
+
+    async def set_lamports(self, address: str, lamports: int) -> None:
+        pre = self.lamports(address)
+        self.balances[address] = max(0, lamports)
+        slot = self.slot
+        self._slot_changes.setdefault(slot, []).append((address, pre, self.balances[address]))
+        for old in [s for s in self._slot_changes if s < slot - 2000]:
+            del self._slot_changes[old]
+        await self._notify(address)
+
+    async def mutate_random(self, count: int, delta: int) -> List[str]:
+        picked = random.sample(list(self.balances), min(count, len(self.balances)))
+        for address in picked:
+            await self.set_lamports(address, self.balances[address] + delta)
+        return picked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http_requests": self.http_requests,
+            "http_429": self.http_429,
+            "http_failed": self.http_failed,
+            "rpc_calls": sum(self.calls.values()),
+            "calls": dict(self.calls),
+            "errors": self.errors,
+            "accounts": len(self.balances),
+            "ws_subscriptions": len(self._ws_subs),
+            "slot": self.slot,
+        }
+
+    def reset_stats(self) -> None:
+        self.http_requests = self.http_429 = self.http_failed = self.errors = 0
+        self.calls.clear()
+
+    # ---- JSON-RPC ----
+
+    def _call(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        method = req.get("method")
+        params = req.get("params") or []
+        req_id = req.get("id")
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return {"jsonrpc": "2.0", "id": req_id, "error": {"code": -32005, "message": "Node is behind"}}
+
+        context = {"slot": self.slot}
+        if method in ("getBalance", "getMultipleAccounts"):
+            keys = params[0] if method == "getMultipleAccounts" and params else params[:1]
+            if not all(is_pubkey(k) for k in keys):
+                return {"jsonrpc": "2.0", "id": req_id, "error": {"code": -32602, "message": "Invalid param: WrongSize"}}
+        if method == "getBalance":
+            result: Any = {"context": context, "value": self.lamports(params[0])}
+        elif method == "getMultipleAccounts":
+            if len(params[0]) > 100:
+                return {"jsonrpc": "2.0", "id": req_id, "error": {"code": -32602, "message": "Too many inputs provided; max 100"}}
+            result = {"context": context, "value": [self._account(a) for a in params[0]]}
+        elif method == "getSlot":
+            # The slot in progress can still change; report the last finished one.
+            result = self.slot - 1
+        elif method == "getHealth":
+            result = "ok"
+        elif method == "getBlock":
+            slot = int(params[0])
+            if slot >= self.slot:
+                return {"jsonrpc": "2.0", "id": req_id, "error": {"code": -32004, "message": f"Block not available for slot {slot}"}}
+            if slot in self.recorded:
+                result = self.recorded[slot]
+                if result is None:
+                    return {"jsonrpc": "2.0", "id": req_id, "error": {
+                        "code": -32007, "message": f"Slot {slot} was skipped, or missing due to ledger jump to recent snapshot"}}
+                self._replay_balances(result)
+            else:
+                result = self._block(slot)
+        elif method == "getSignaturesForAddress":
+            limit = (params[1] if len(params) > 1 else {}).get("limit", 10)
+            result = [
+                {
+                    "signature": b58encode(os.urandom(64)),
+                    "slot": self.slot - i,
+                    "err": None,
+                    "memo": None,
+                    "blockTime": int(time.time()) - i,
+                    "confirmationStatus": "finalized",
+                }
+                for i in range(min(limit, 5))
+            ]
+        else:
+            return {"jsonrpc": "2.0", "id": req_id, "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": req_id, "result": result}
+
+    def _account(self, address: str) -> Dict[str, Any]:
+        return {
+            "lamports": self.lamports(address),
+            "owner": "11111111111111111111111111111111",
+            "executable": False,
+            "rentEpoch": 18446744073709551615,
+            "space": 0,
+            "data": ["", "base64"],
+        }
+
+    def _replay_balances(self, block: Dict[str, Any]) -> None:
+        # Keep account reads consistent with the recording once its block has been served.
+        for tx in block.get("transactions") or []:
+            keys = tx["transaction"]["accountKeys"]
+            for key, post in zip(keys, (tx.get("meta") or {}).get("postBalances", [])):
+                self.balances[key["pubkey"] if isinstance(key, dict) else key] = post
+
+    def _block(self, slot: int) -> Dict[str, Any]:
+        def tx(changes: List[Tuple[str, int, int]]) -> Dict[str, Any]:
+            payer = random_address()
+            return {
+                "transaction": {
+                    "signatures": [b58encode(os.urandom(64))],
+                    "accountKeys": [{"pubkey": payer, "signer": True, "writable": True, "source": "transaction"}] + [
+                        {"pubkey": address, "signer": False, "writable": True, "source": "transaction"}
+                        for address, _pre, _post in changes
+                    ],
+                },
+                "meta": {
+                    "err": None,
+                    "fee": 5000,
+                    "preBalances": [10_000_000_000] + [pre for _address, pre, _post in changes],
+                    "postBalances": [10_000_000_000 - 5000] + [post for _address, _pre, post in changes],
+                },
+                "version": 0,
+            }
+
+        transactions = [tx([change]) for change in self._slot_changes.get(slot, [])]
+        transactions += [tx([(random_address(), 1, 2), (random_address(), 3, 4)]) for _ in range(self.block_noise)]
+        random.shuffle(transactions)
+        return {
+            "blockHeight": slot - 20_000_000,
+            "blockTime": int(time.time()),
+            "blockhash": b58encode(slot.to_bytes(32, "big")),
+            "parentSlot": slot - 1,
+            "previousBlockhash": b58encode((slot - 1).to_bytes(32, "big")),
+            "transactions": transactions,
+        }
+
+    def _over_rps(self) -> bool:
+        if not self.max_rps:
+            return False
+        second = int(time.monotonic())
+        window, count = self._rps_window
+        if window != second:
+            window, count = second, 0
+        count += 1
+        self._rps_window = (window, count)
+        return count > self.max_rps
+
+    async def handle_post(self, request: web.Request) -> web.StreamResponse:
+        self.http_requests += 1
+        if self.fail_status:
+            self.http_failed += 1
+            return web.Response(status=self.fail_status, text="endpoint down (mock)")
+        if self._over_rps() or (self.rate_429 and random.random() < self.rate_429):
+            self.http_429 += 1
+            return web.json_response(
+                {"jsonrpc": "2.0", "id": None, "error": {"code": 429, "message": "Too many requests"}},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        body = await request.json()
+        if self.capacity:
+            if self._capacity is None:
+                self._capacity = asyncio.Semaphore(self.capacity)
+            async with self._capacity:
+                await self._delay()
+        else:
+            await self._delay()
+
+        if isinstance(body, list):
+            return web.json_response([self._call(r) for r in body])
+        return web.json_response(self._call(body))
+
+    async def _delay(self) -> None:
+        delay = self.latency.sample_ms()
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+    # ---- WebSocket ----
+
+    async def handle_ws(self, request: web.Request) -> web.StreamResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        mine: Set[int] = set()
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                req = json.loads(msg.data)
+                method, params, req_id = req.get("method"), req.get("params") or [], req.get("id")
+                self.calls[method] = self.calls.get(method, 0) + 1
+                if method == "accountSubscribe":
+                    sub_id = self._next_sub
+                    self._next_sub += 1
+                    self._ws_subs[sub_id] = (ws, params[0])
+                    self._addr_subs.setdefault(params[0], set()).add(sub_id)
+                    self.lamports(params[0])
+                    mine.add(sub_id)
+                    await ws.send_json({"jsonrpc": "2.0", "id": req_id, "result": sub_id})
+                elif method == "accountUnsubscribe":
+                    ok = self._drop_sub(params[0])
+                    mine.discard(params[0])
+                    await ws.send_json({"jsonrpc": "2.0", "id": req_id, "result": ok})
+                else:
+                    await ws.send_json({"jsonrpc": "2.0", "id": req_id, "error": {"code": -32601, "message": "Method not found"}})
+        finally:
+            for sub_id in mine:
+                self._drop_sub(sub_id)
+        return ws
+
+    def _drop_sub(self, sub_id: int) -> bool:
+        entry = self._ws_subs.pop(sub_id, None)
+        if entry is None:
+            return False
+        subs = self._addr_subs.get(entry[1])
+        if subs:
+            subs.discard(sub_id)
+        return True
+
+    async def _notify(self, address: str) -> None:
+        for sub_id in list(self._addr_subs.get(address, ())):
+            ws, _addr = self._ws_subs[sub_id]
+            if ws.closed:
+                continue
+            await ws.send_json({
+                "jsonrpc": "2.0",
+                "method": "accountNotification",
+                "params": {
+                    "subscription": sub_id,
+                    "result": {"context": {"slot": self.slot}, "value": self._account(address)},
+                },
+            })
+
+    # ---- admin / wiring ----
+
+    async def handle_root_get(self, request: web.Request) -> web.StreamResponse:
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self.handle_ws(request)
+        return web.json_response(self.stats())
+
+    async def handle_stats(self, request: web.Request) -> web.StreamResponse:
+        return web.json_response(self.stats())
+
+    async def handle_reset(self, request: web.Request) -> web.StreamResponse:
+        self.reset_stats()
+        return web.json_response({"ok": True})
+
+    async def handle_mutate(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if "address" in body:
+            await self.set_lamports(body["address"], int(body["lamports"]))
+            return web.json_response({"mutated": 1})
+        if "balances" in body:
+            for address, lamports in body["balances"].items():
+                await self.set_lamports(address, int(lamports))
+            return web.json_response({"mutated": len(body["balances"])})
+        picked = await self.mutate_random(int(body.get("count", 1)), int(body.get("delta", -5000)))
+        return web.json_response({"mutated": len(picked)})
+
+    async def handle_fail(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.fail_status = int(body.get("status", 0))
+        return web.json_response({"fail_status": self.fail_status})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/", self.handle_post)
+        app.router.add_get("/", self.handle_root_get)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_post("/admin/reset", self.handle_reset)
+        app.router.add_post("/admin/mutate", self.handle_mutate)
+        app.router.add_post("/admin/fail", self.handle_fail)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8899) -> web.AppRunner:
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def run_script(self, steps: List[Dict[str, Any]]) -> None:
+        """
+        Balance-mutation script: [{"at": 5, "address": "...", "lamports": 1},
+        {"at": 10, "random": 100, "delta": -5000}, ...], `at` in seconds from start.
+        """
+        t0 = time.monotonic()
+        for step in sorted(steps, key=lambda s: s.get("at", 0)):
+            await asyncio.sleep(max(0.0, t0 + step.get("at", 0) - time.monotonic()))
+            if "address" in step:
+                await self.set_lamports(step["address"], int(step["lamports"]))
+            else:
+                await self.mutate_random(int(step.get("random", 1)), int(step.get("delta", -5000)))
+
+    async def mutate_forever(self, every: float, count: int, delta: int) -> None:
+        while True:
+            await asyncio.sleep(every)
+            await self.mutate_random(count, delta)
+
+async def serve(args: argparse.Namespace) -> None:
+    mock = MockSolanaRpc(
+        latency=Latency(args.latency, args.stall_rate, args.stall_ms),
+        error_rate=args.error_rate,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        max_rps=args.max_rps,
+        default_lamports=args.default_lamports,
+        fail_status=args.fail_status,
+        capacity=args.capacity,
+        slot_ms=args.slot_ms,
+        block_noise=args.block_noise,
+    )
+    if args.blocks:
+        with open(args.blocks) as f:
+            mock.load_blocks(json.load(f))
+    await mock.start(args.host, args.port)
+    logger.info("Mock Solana RPC on http://%s:%d/ (ws on the same URL)", args.host, args.port)
+
+    tasks = []
+    if args.script:
+        with open(args.script) as f:
+            tasks.append(asyncio.create_task(mock.run_script(json.load(f))))
+    if args.mutate_every:
+        tasks.append(asyncio.create_task(mock.mutate_forever(args.mutate_every, args.mutate_count, args.mutate_delta)))
+    await asyncio.Event().wait()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local stand-in Solana JSON-RPC server")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8899)
+    p.add_argument("--latency", default="0", help='"fixed:MS", "uniform:LO,HI" or "lognormal:MEDIAN_MS,SIGMA"')
+    p.add_argument("--stall-rate", type=float, default=0.0, help="probability a request stalls for --stall-ms")
+    p.add_argument("--stall-ms", type=float, default=5000.0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="probability a call returns a JSON-RPC error")
+    p.add_argument("--rate-429", type=float, default=0.0, help="probability an HTTP request gets a 429")
+    p.add_argument("--retry-after", type=int, default=1)
+    p.add_argument("--max-rps", type=float, default=0.0, help="HTTP requests/s before answering 429 (0 = unlimited)")
+    p.add_argument("--default-lamports", type=int, default=1_000_000_000)
+    p.add_argument("--capacity", type=int, default=0, help="HTTP requests served concurrently; more queue (0 = unlimited)")
+    p.add_argument("--fail-status", type=int, default=0, help="answer every RPC POST with this HTTP status (0 = healthy)")
+    p.add_argument("--slot-ms", type=float, default=400.0, help="milliseconds per slot")
+    p.add_argument("--blocks", help="JSON file of recorded blocks to serve from getBlock")
+    p.add_argument("--block-noise", type=int, default=0, help="unrelated transactions per synthesised block")
+    p.add_argument("--script", help="JSON balance-mutation script")
+    p.add_argument("--mutate-every", type=float, default=0.0, help="seconds between random mutations")
+    p.add_argument("--mutate-count", type=int, default=10)
+    p.add_argument("--mutate-delta", type=int, default=-5000)
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)